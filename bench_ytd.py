@@ -0,0 +1,320 @@
+#!/usr/bin/env python3
+
+import os
+import re
+import sys
+import json
+import time
+import shutil
+import tempfile
+import argparse
+import threading
+import subprocess
+import contextlib
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from typing import List, Dict, Any
+
+BASELINE_FILE = Path(__file__).with_name('bench_baseline.json')
+SCENARIOS = ('text', 'channel-all', 'channel-shorts', 'list')
+DEFAULT_SIZES = (10, 1000)
+PAGE_SIZE = 30
+
+def fake_video_id(n: int) -> str:
+    return f"v{n:010d}"
+
+def fake_duration(n: int) -> int:
+    return 30 if n % 3 == 0 else 300
+
+class FakeYouTubeHandler(BaseHTTPRequestHandler):
+    media_size = 64 * 1024
+
+    def do_GET(self):
+        match = re.match(r'^/api/channel/(\d+)/page/(\d+)$', self.path)
+        if match:
+            size, page = int(match.group(1)), int(match.group(2))
+            entries = []
+            for i in range(page * PAGE_SIZE, min(size, (page + 1) * PAGE_SIZE)):
+                n = size - 1 - i
+                entry = {'id': fake_video_id(n), 'title': f"Video {n}"}
+                if n % 5:
+                    entry['duration'] = fake_duration(n)
+                entries.append(entry)
+            return self._send_json({'entries': entries, 'more': (page + 1) * PAGE_SIZE < size})
+
+        match = re.match(r'^/api/video/v(\d+)$', self.path)
+        if match:
+            n = int(match.group(1))
+            return self._send_json({
+                'id': fake_video_id(n),
+                'title': f"Video {n}",
+                'duration': fake_duration(n),
+                'upload_date': '20240101',
+                'view_count': n,
+            })
+
+        if re.match(r'^/media/v\d+$', self.path):
+            self.send_response(200)
+            self.send_header('Content-Type', 'video/mp4')
+            self.send_header('Content-Length', str(self.media_size))
+            self.end_headers()
+            chunk = b'\0' * min(self.media_size, 64 * 1024)
+            remaining = self.media_size
+            while remaining > 0:
+                self.wfile.write(chunk[:remaining])
+                remaining -= len(chunk)
+            return
+
+        self.send_error(404)
+
+    def _send_json(self, data):
+        body = json.dumps(data).encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+def start_fake_server(media_size: int):
+    handler = type('Handler', (FakeYouTubeHandler,), {'media_size': media_size})
+    server = ThreadingHTTPServer(('127.0.0.1', 0), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}"
+
+def install_fake_extractor(media_size: int):
+    import yt_dlp
+    from yt_dlp.extractor.common import InfoExtractor
+
+    class FakeYouTubeIE(InfoExtractor):
+        IE_NAME = 'fakeyoutube'
+        _VALID_URL = r'(?P<base>http://127\.0\.0\.1:\d+)/(?P<kind>channel|watch)/(?P<id>\w+)'
+
+        def _real_extract(self, url):
+            base, kind, item_id = self._match_valid_url(url).group('base', 'kind', 'id')
+            if kind == 'channel':
+                return self.playlist_result(self._entries(base, item_id), item_id, f"Channel {item_id}")
+            info = self._download_json(f"{base}/api/video/{item_id}", item_id, note=False)
+            info['formats'] = [{
+                'format_id': '18',
+                'url': f"{base}/media/{item_id}",
+                'ext': 'mp4',
+                'vcodec': 'avc1.42001E',
+                'acodec': 'mp4a.40.2',
+                'height': 360,
+                'filesize': media_size,
+            }]
+            return info
+
+        def _entries(self, base, channel_id):
+            page = 0
+            while True:
+                data = self._download_json(f"{base}/api/channel/{channel_id}/page/{page}", channel_id, note=False)
+                for entry in data['entries']:
+                    yield self.url_result(f"{base}/watch/{entry['id']}", FakeYouTubeIE, entry['id'], entry['title'],
+                                          **({'duration': entry['duration']} if 'duration' in entry else {}))
+                if not data['more']:
+                    return
+                page += 1
+
+    class BenchYoutubeDL(yt_dlp.YoutubeDL):
+        def __init__(self, *args, **kwargs):
+            super().__init__(*args, **kwargs)
+            extractor = FakeYouTubeIE()
+            self.add_info_extractor(extractor)
+            self._ies = {extractor.ie_key(): extractor, **self._ies}
+
+    yt_dlp.YoutubeDL = BenchYoutubeDL
+
+def peak_rss_mb():
+    import resource
+
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return round(peak / (1024 * 1024) if sys.platform == 'darwin' else peak / 1024, 1)
+
+def summarize_phases(snapshot: Dict[str, Any]) -> Dict[str, Any]:
+    phases = {}
+    for phase, histogram in snapshot['phases'].items():
+        count = histogram['count']
+        p95 = None
+        running = 0
+        for bound, bucket_count in histogram['buckets'].items():
+            running = bucket_count
+            if count and running >= 0.95 * count:
+                p95 = float(bound) * 1000
+                break
+        phases[phase] = {
+            'count': count,
+            'mean_ms': round(histogram['sum'] / count * 1000, 2) if count else None,
+            'p95_ms': p95,
+        }
+    return phases
+
+def run_scenario(params: Dict[str, Any]) -> Dict[str, Any]:
+    workdir = tempfile.mkdtemp(prefix='ytd-bench-')
+    os.chdir(workdir)
+    sys.path.insert(0, str(Path(__file__).resolve().parent))
+    install_fake_extractor(params['media_size'])
+    import ytd
+
+    ytd.RATE_CONFIG.update(rate=params['rate'], max_rate=params['rate'])
+    scenario, size, base_url = params['scenario'], params['size'], params['base_url']
+    settings = ytd.build_settings('out', 'best', workers=params['workers'], resume=True, sync=False)
+    channel_url = f"{base_url}/channel/{size}"
+    if scenario == 'text':
+        with open('links.txt', 'w') as f:
+            for n in range(size):
+                f.write(f"{base_url}/watch/{fake_video_id(n)}\n")
+
+    started = time.perf_counter()
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull), contextlib.redirect_stderr(devnull):
+        if scenario == 'text':
+            items = ytd.download_from_text_file('links.txt', settings)['downloaded']
+        elif scenario == 'channel-all':
+            items = ytd.download_videos_streaming(channel_url, settings, shorts_only=False)['downloaded']
+        elif scenario == 'channel-shorts':
+            items = ytd.download_videos_streaming(channel_url, settings, shorts_only=True)['downloaded']
+        else:
+            items = sum(1 for _ in ytd.iter_channel_videos(channel_url, shorts_only=False))
+    elapsed = time.perf_counter() - started
+
+    snapshot = ytd.metrics.snapshot()
+    downloaded_bytes = snapshot['counters'].get('downloaded_bytes', 0)
+    os.chdir(tempfile.gettempdir())
+    shutil.rmtree(workdir, ignore_errors=True)
+    return {
+        'scenario': scenario,
+        'size': size,
+        'items': items,
+        'elapsed_s': round(elapsed, 3),
+        'items_per_s': round(items / elapsed, 2) if elapsed else None,
+        'mb_per_s': round(downloaded_bytes / elapsed / (1024 * 1024), 2) if elapsed else None,
+        'peak_rss_mb': peak_rss_mb(),
+        'phases': summarize_phases(snapshot),
+    }
+
+def run_child(params: Dict[str, Any]) -> Dict[str, Any]:
+    result = subprocess.run([sys.executable, __file__, '--child', json.dumps(params)],
+                            stdout=subprocess.PIPE, stderr=subprocess.PIPE, universal_newlines=True)
+    lines = result.stdout.strip().splitlines()
+    if result.returncode != 0 or not lines:
+        return {'scenario': params['scenario'], 'size': params['size'],
+                'error': (result.stderr.strip().splitlines() or ['no output'])[-1]}
+    return json.loads(lines[-1])
+
+def result_key(result: Dict[str, Any]) -> str:
+    return f"{result['scenario']}:{result['size']}"
+
+def compare_to_baseline(results: List[Dict[str, Any]], baseline: Dict[str, Any], threshold: float):
+    regressions = []
+    for result in results:
+        previous = baseline.get(result_key(result))
+        result['baseline'] = None
+        if not previous or 'error' in result or 'error' in previous:
+            continue
+        changes = {}
+        if previous.get('items_per_s'):
+            changes['items_per_s'] = (result['items_per_s'] - previous['items_per_s']) / previous['items_per_s']
+        if previous.get('peak_rss_mb'):
+            changes['peak_rss_mb'] = (result['peak_rss_mb'] - previous['peak_rss_mb']) / previous['peak_rss_mb']
+        result['baseline'] = {name: round(change * 100, 1) for name, change in changes.items()}
+        if changes.get('items_per_s', 0) < -threshold or changes.get('peak_rss_mb', 0) > threshold:
+            regressions.append(result_key(result))
+    return regressions
+
+def print_report(results: List[Dict[str, Any]], regressions: List[str]):
+    print(f"\n{'scenario':<16}{'size':>8}{'items':>8}{'time s':>10}{'items/s':>10}{'MB/s':>8}{'RSS MB':>9}  vs baseline")
+    print("-" * 90)
+    for result in results:
+        if 'error' in result:
+            print(f"{result['scenario']:<16}{result['size']:>8}  ERROR: {result['error']}")
+            continue
+        versus = ""
+        if result.get('baseline'):
+            versus = ", ".join(f"{name} {change:+.1f}%" for name, change in result['baseline'].items())
+            if result_key(result) in regressions:
+                versus += "  REGRESSION"
+        print(f"{result['scenario']:<16}{result['size']:>8}{result['items']:>8}{result['elapsed_s']:>10.2f}"
+              f"{result['items_per_s']:>10.1f}{result['mb_per_s']:>8.2f}{result['peak_rss_mb']:>9.1f}  {versus}")
+    print("\nPer-phase latency (mean / p95 ms):")
+    for result in results:
+        if 'error' in result:
+            continue
+        phases = ", ".join(f"{phase} {stats['mean_ms']}/{stats['p95_ms']}" for phase, stats in sorted(result['phases'].items()))
+        print(f"  {result_key(result):<22} {phases}")
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Offline benchmarks for ytd.py against a local fake YouTube")
+    parser.add_argument('--scenarios', default=",".join(SCENARIOS),
+                        help=f"comma-separated scenarios (default: {','.join(SCENARIOS)})")
+    parser.add_argument('--sizes', default=",".join(str(size) for size in DEFAULT_SIZES),
+                        help="comma-separated channel/link-file sizes, e.g. 10,1000,50000 (default: 10,1000)")
+    parser.add_argument('--workers', type=int, default=8,
+                        help="download workers passed to ytd (default: 8)")
+    parser.add_argument('--media-size', type=int, default=64 * 1024,
+                        help="bytes served per fake video (default: 65536)")
+    parser.add_argument('--rate', type=float, default=100000.0,
+                        help="request rate given to ytd's rate controller (default: effectively unlimited)")
+    parser.add_argument('--baseline', default=str(BASELINE_FILE),
+                        help="baseline file to compare against (default: bench_baseline.json)")
+    parser.add_argument('--save-baseline', action='store_true',
+                        help="store these results as the new baseline")
+    parser.add_argument('--threshold', type=float, default=0.10,
+                        help="relative change reported as a regression (default: 0.10)")
+    parser.add_argument('--output', metavar='FILE',
+                        help="also write the raw results as JSON")
+    parser.add_argument('--child', help=argparse.SUPPRESS)
+    return parser.parse_args(argv)
+
+def main(argv=None):
+    args = parse_args(argv)
+    if args.child:
+        print(json.dumps(run_scenario(json.loads(args.child))))
+        return 0
+
+    scenarios = [scenario.strip() for scenario in args.scenarios.split(',') if scenario.strip()]
+    unknown = [scenario for scenario in scenarios if scenario not in SCENARIOS]
+    if unknown:
+        print(f"Unknown scenario(s): {', '.join(unknown)}")
+        return 2
+    sizes = [int(size) for size in args.sizes.split(',') if size.strip()]
+
+    server, base_url = start_fake_server(args.media_size)
+    results = []
+    try:
+        for size in sizes:
+            for scenario in scenarios:
+                print(f"Running {scenario} with {size} entries...", flush=True)
+                results.append(run_child({
+                    'scenario': scenario,
+                    'size': size,
+                    'base_url': base_url,
+                    'workers': args.workers,
+                    'media_size': args.media_size,
+                    'rate': args.rate,
+                }))
+    finally:
+        server.shutdown()
+
+    baseline_path = Path(args.baseline)
+    baseline = json.loads(baseline_path.read_text()) if baseline_path.exists() else {}
+    regressions = compare_to_baseline(results, baseline, args.threshold)
+    print_report(results, regressions)
+
+    if args.output:
+        Path(args.output).write_text(json.dumps(results, indent=2) + "\n")
+    if args.save_baseline:
+        baseline.update({result_key(result): {k: v for k, v in result.items() if k != 'baseline'}
+                         for result in results if 'error' not in result})
+        baseline_path.write_text(json.dumps(baseline, indent=2, sort_keys=True) + "\n")
+        print(f"\nBaseline saved to {baseline_path}")
+    if regressions:
+        print(f"\nRegressions: {', '.join(regressions)}")
+        return 1
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
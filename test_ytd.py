@@ -0,0 +1,38 @@
+import pytest
+
+import ytd
+
+# Messages as yt-dlp's YouTube extractor reports them
+PERMANENT_ERRORS = [
+    ("ERROR: [youtube] dQw4w9WgXcQ: Private video. Sign in if you've been granted access to this video", 'private'),
+    ("ERROR: [youtube] dQw4w9WgXcQ: Join this channel to get access to members-only content like this video, "
+     "and other exclusive perks.", 'private'),
+    ("ERROR: [youtube] dQw4w9WgXcQ: Sign in to confirm your age. This video may be inappropriate for some users.",
+     'age_restricted'),
+    ("ERROR: [youtube] dQw4w9WgXcQ: Video unavailable. This video has been removed by the uploader", 'removed'),
+    ("ERROR: [youtube] dQw4w9WgXcQ: Video unavailable. The uploader has not made this video available in your "
+     "country", 'geo_blocked'),
+]
+
+THROTTLE_ERRORS = [
+    "ERROR: [youtube] dQw4w9WgXcQ: Sign in to confirm you’re not a bot. Use --cookies-from-browser or --cookies "
+    "for the authentication.",
+    "ERROR: [youtube] dQw4w9WgXcQ: Unable to download API page: HTTP Error 429: Too Many Requests",
+]
+
+@pytest.mark.parametrize('message, failure_class', PERMANENT_ERRORS)
+def test_permanent_errors_are_not_retried(message, failure_class):
+    assert ytd.classify_failure(Exception(message)) == failure_class
+    assert ytd.is_permanent_failure(failure_class)
+    assert not ytd.is_throttle_error(Exception(message))
+
+@pytest.mark.parametrize('message', THROTTLE_ERRORS)
+def test_throttle_errors_back_off(message):
+    assert ytd.classify_failure(Exception(message)) == 'throttle'
+    assert not ytd.is_permanent_failure('throttle')
+
+def test_rate_limit_abort_is_throttle():
+    assert ytd.classify_failure(ytd.RateLimitAborted("Bot detection persisted after 6 pauses")) == 'throttle'
+
+def test_other_errors_are_transient():
+    assert ytd.classify_failure(Exception("Unable to download webpage: <urlopen error timed out>")) == 'transient'
@@ -5,10 +5,324 @@ import sys
 import json
 import subprocess
 import time
+import re
+import atexit
+import itertools
+import collections
+import contextlib
+import sqlite3
+import errno
+import hashlib
+import shutil
+import queue
 import random
+import zlib
+import csv
+import argparse
+import threading
+import socket
+import uuid
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor, as_completed, wait
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
 from pathlib import Path
+from urllib.parse import parse_qs, urlparse
 from typing import List, Dict, Any
 
+print_lock = threading.Lock()
+
+def log(*args, **kwargs):
+    with print_lock:
+        print(*args, **kwargs)
+
+PHASE_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600)
+RATE_WINDOW = 10.0
+
+class Metrics:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.started = time.time()
+        self.counters = {}
+        self.histograms = {}
+        self.gauges = {}
+        self.file_bytes = {}
+        self.byte_samples = collections.deque()
+        self.postprocess_started = {}
+
+    def inc(self, name: str, value: float = 1):
+        with self.lock:
+            self.counters[name] = self.counters.get(name, 0) + value
+
+    def observe(self, phase: str, seconds: float):
+        with self.lock:
+            histogram = self.histograms.get(phase)
+            if histogram is None:
+                histogram = self.histograms[phase] = {'buckets': [0] * len(PHASE_BUCKETS), 'sum': 0.0, 'count': 0}
+            for i, bound in enumerate(PHASE_BUCKETS):
+                if seconds <= bound:
+                    histogram['buckets'][i] += 1
+            histogram['sum'] += seconds
+            histogram['count'] += 1
+
+    @contextlib.contextmanager
+    def timer(self, phase: str, **trace_args):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - started
+            self.observe(phase, elapsed)
+            if tracer.enabled:
+                tracer.record(phase, started, elapsed, trace_args)
+
+    def track(self, name: str, fn):
+        with self.lock:
+            self.gauges.setdefault(name, []).append(fn)
+
+    def untrack(self, name: str, fn):
+        with self.lock:
+            if fn in self.gauges.get(name, []):
+                self.gauges[name].remove(fn)
+
+    def progress_hook(self, status):
+        filename = status.get('tmpfilename') or status.get('filename')
+        downloaded = status.get('downloaded_bytes')
+        if not filename or downloaded is None:
+            return
+        with self.lock:
+            if status.get('status') == 'finished':
+                previous = self.file_bytes.pop(filename, None)
+                if previous is None:
+                    previous = self.file_bytes.pop(f"{filename}.part", 0)
+                delta = max(0, downloaded - previous)
+            else:
+                delta = max(0, downloaded - self.file_bytes.get(filename, 0))
+                self.file_bytes[filename] = downloaded
+            if delta:
+                now = time.time()
+                self.counters['downloaded_bytes'] = self.counters.get('downloaded_bytes', 0) + delta
+                self.byte_samples.append((now, delta))
+                while self.byte_samples and now - self.byte_samples[0][0] > RATE_WINDOW:
+                    self.byte_samples.popleft()
+
+    def postprocessor_hook(self, status):
+        key = (status.get('postprocessor'), (status.get('info_dict') or {}).get('id'))
+        if status.get('status') == 'started':
+            with self.lock:
+                self.postprocess_started[key] = time.perf_counter()
+        elif status.get('status') == 'finished':
+            with self.lock:
+                started = self.postprocess_started.pop(key, None)
+            if started is not None:
+                self.observe('postprocess', time.perf_counter() - started)
+
+    def snapshot(self) -> Dict[str, Any]:
+        now = time.time()
+        with self.lock:
+            counters = dict(self.counters)
+            gauges = {name: sum(fn() for fn in fns) for name, fns in self.gauges.items()}
+            histograms = {
+                phase: {
+                    'buckets': dict(zip([str(bound) for bound in PHASE_BUCKETS], histogram['buckets'])),
+                    'sum': round(histogram['sum'], 4),
+                    'count': histogram['count'],
+                }
+                for phase, histogram in self.histograms.items()
+            }
+            recent_bytes = sum(delta for sample_time, delta in self.byte_samples if now - sample_time <= RATE_WINDOW)
+        elapsed = max(now - self.started, 1e-6)
+        cache = _metadata_cache
+        cache_stats = cache.stats() if cache is not None else {'hits': 0, 'misses': 0}
+        lookups = cache_stats['hits'] + cache_stats['misses']
+        return {
+            'timestamp': now,
+            'uptime_seconds': round(elapsed, 2),
+            'bytes_per_second': round(counters.get('downloaded_bytes', 0) / elapsed, 1),
+            'recent_bytes_per_second': round(recent_bytes / RATE_WINDOW, 1),
+            'counters': counters,
+            'gauges': gauges,
+            'phases': histograms,
+            'cache': {**cache_stats, 'hit_rate': round(cache_stats['hits'] / lookups, 4) if lookups else None},
+        }
+
+    def to_prometheus(self) -> str:
+        snapshot = self.snapshot()
+        lines = [
+            '# HELP ytd_phase_seconds Time spent per phase (scan, probe, download, postprocess).',
+            '# TYPE ytd_phase_seconds histogram',
+        ]
+        for phase, histogram in sorted(snapshot['phases'].items()):
+            for bound, count in histogram['buckets'].items():
+                lines.append(f'ytd_phase_seconds_bucket{{phase="{phase}",le="{bound}"}} {count}')
+            lines.append(f'ytd_phase_seconds_bucket{{phase="{phase}",le="+Inf"}} {histogram["count"]}')
+            lines.append(f'ytd_phase_seconds_sum{{phase="{phase}"}} {histogram["sum"]}')
+            lines.append(f'ytd_phase_seconds_count{{phase="{phase}"}} {histogram["count"]}')
+        for name, value in sorted(snapshot['counters'].items()):
+            lines.append(f'# TYPE ytd_{name}_total counter')
+            lines.append(f'ytd_{name}_total {value}')
+        for name, value in sorted(snapshot['gauges'].items()):
+            lines.append(f'# TYPE ytd_{name} gauge')
+            lines.append(f'ytd_{name} {value}')
+        lines.append('# TYPE ytd_bytes_per_second gauge')
+        lines.append(f'ytd_bytes_per_second {snapshot["recent_bytes_per_second"]}')
+        lines.append('# TYPE ytd_cache_hits_total counter')
+        lines.append(f'ytd_cache_hits_total {snapshot["cache"]["hits"]}')
+        lines.append('# TYPE ytd_cache_misses_total counter')
+        lines.append(f'ytd_cache_misses_total {snapshot["cache"]["misses"]}')
+        return '\n'.join(lines) + '\n'
+
+    def write_stats_file(self, path: str):
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump(self.snapshot(), f, indent=2)
+        os.replace(tmp_path, path)
+
+metrics = Metrics()
+
+TRACE_MAX_EVENTS = 500000
+NULL_SPAN = contextlib.nullcontext()
+
+class Tracer:
+    def __init__(self):
+        self.enabled = False
+        self.path = None
+        self.pid = os.getpid()
+        self.started = time.perf_counter()
+        self.events = []
+        self.thread_names = {}
+        self.dropped = 0
+
+    def start(self, path: str):
+        self.path = path
+        self.started = time.perf_counter()
+        self.enabled = True
+        atexit.register(self.save)
+
+    def span(self, name: str, **args):
+        if not self.enabled:
+            return NULL_SPAN
+        return self._span(name, args)
+
+    @contextlib.contextmanager
+    def _span(self, name, args):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(name, started, time.perf_counter() - started, args)
+
+    def record(self, name: str, started: float, elapsed: float, args: Dict[str, Any] = None):
+        if len(self.events) >= TRACE_MAX_EVENTS:
+            self.dropped += 1
+            return
+        thread = threading.current_thread()
+        if thread.ident not in self.thread_names:
+            self.thread_names[thread.ident] = thread.name
+        event = {'name': name, 'ph': 'X', 'pid': self.pid, 'tid': thread.ident,
+                 'ts': round((started - self.started) * 1e6, 1), 'dur': round(elapsed * 1e6, 1)}
+        if args:
+            event['args'] = args
+        self.events.append(event)
+
+    def save(self):
+        if not self.path:
+            return
+        threads = [{'name': 'thread_name', 'ph': 'M', 'pid': self.pid, 'tid': tid, 'args': {'name': name}}
+                   for tid, name in list(self.thread_names.items())]
+        process = {'name': 'process_name', 'ph': 'M', 'pid': self.pid, 'args': {'name': 'ytd'}}
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump({'traceEvents': [process, *threads, *self.events], 'displayTimeUnit': 'ms',
+                       'otherData': {'dropped_events': self.dropped}}, f)
+        os.replace(tmp_path, self.path)
+
+tracer = Tracer()
+
+def trace_video_args(url: str, label: str = "") -> Dict[str, Any]:
+    return {'video': canonical_video_id(url) or url, 'label': label.strip('[]')}
+
+class SamplingProfiler:
+    def __init__(self, path: str, interval: float = 0.005):
+        self.path = path
+        self.interval = interval
+        self.stacks = collections.Counter()
+        self.samples = 0
+        self.stop_event = threading.Event()
+        self.thread = threading.Thread(target=self._sample_loop, name='ytd-profiler', daemon=True)
+
+    def start(self):
+        self.thread.start()
+        atexit.register(self.stop)
+        return self
+
+    def _sample_loop(self):
+        own = threading.get_ident()
+        while not self.stop_event.wait(self.interval):
+            names = {thread.ident: thread.name for thread in threading.enumerate()}
+            for tid, frame in sys._current_frames().items():
+                if tid == own:
+                    continue
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+                    frame = frame.f_back
+                group = re.sub(r'_\d+$', '', names.get(tid, 'thread'))
+                self.stacks[';'.join([group, *reversed(stack)])] += 1
+            self.samples += 1
+
+    def stop(self):
+        if self.stop_event.is_set():
+            return
+        self.stop_event.set()
+        self.thread.join()
+        # Collapsed stacks, one "frame;frame;frame count" per line, as read by flamegraph.pl and speedscope
+        with open(self.path, 'w') as f:
+            for stack, count in self.stacks.most_common():
+                f.write(f"{stack} {count}\n")
+
+def start_stats_writer(path: str, interval: float = 10.0):
+    stop_event = threading.Event()
+
+    def flush_loop():
+        while not stop_event.wait(interval):
+            try:
+                metrics.write_stats_file(path)
+            except OSError as e:
+                log(f"Failed to write stats file {path}: {e}")
+
+    def flush_final():
+        stop_event.set()
+        try:
+            metrics.write_stats_file(path)
+        except OSError:
+            pass
+
+    threading.Thread(target=flush_loop, daemon=True).start()
+    atexit.register(flush_final)
+
+def start_metrics_server(port: int, host: str = '127.0.0.1'):
+    class MetricsHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split('?', 1)[0] != '/metrics':
+                self.send_error(404)
+                return
+            body = metrics.to_prometheus().encode('utf-8')
+            self.send_response(200)
+            self.send_header('Content-Type', 'text/plain; version=0.0.4')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    server = ThreadingHTTPServer((host, port), MetricsHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    print(f"Metrics available at http://{host}:{server.server_address[1]}/metrics")
+    return server
+
 def install_yt_dlp():
     try:
         import yt_dlp
@@ -37,261 +351,2557 @@ def get_yt_dlp_options():
         'socket_timeout': 60,
         'retries': 5,
         'fragment_retries': 5,
-        'sleep_interval': 1,
-        'max_sleep_interval': 5,
         'ignoreerrors': True,
         'no_warnings': False,
     }
 
+CONNECTION_CONFIG = {
+    'max_connections': 16,
+}
+SIZE_UNITS = {'': 1, 'K': 1024, 'M': 1024 ** 2, 'G': 1024 ** 3}
+
+def parse_size(value):
+    if value is None or isinstance(value, int):
+        return value
+    match = re.match(r'^\s*(\d+(?:\.\d+)?)\s*([KMG]?)i?B?\s*$', str(value), re.IGNORECASE)
+    if not match:
+        raise ValueError(f"invalid size: {value}")
+    return int(float(match.group(1)) * SIZE_UNITS[match.group(2).upper()])
+
+def get_connection_options(settings: Dict[str, Any]) -> Dict[str, Any]:
+    # yt-dlp only parallelises fragmented formats; plain https downloads stay on one connection
+    parallel = max(1, int(settings.get('workers', 1)), int(settings.get('max_concurrent', 1)))
+    connections = max(1, min(int(settings.get('connections', 1)), CONNECTION_CONFIG['max_connections'] // parallel))
+    options = {'concurrent_fragment_downloads': connections}
+    if settings.get('chunk_size'):
+        options['http_chunk_size'] = settings['chunk_size']
+    return options
+
+COOKIE_FILE = 'ytd_cookies.txt'
+SESSION_CONFIG = {
+    'enabled': True,
+    'cookie_file': COOKIE_FILE,
+}
+
+# Every YoutubeDL param that build_request_director reads; instances only share a director when all of them match
+DIRECTOR_PARAMS = (
+    'http_headers', 'proxy', 'source_address', 'socket_timeout', 'impersonate', 'nocheckcertificate',
+    'legacyserverconnect', 'enable_file_urls', 'compat_opts', 'debug_printtraffic',
+    'client_certificate', 'client_certificate_key', 'client_certificate_password',
+)
+
+def director_key(params: Dict[str, Any]) -> str:
+    return json.dumps({name: params.get(name) for name in DIRECTOR_PARAMS}, sort_keys=True,
+                      default=lambda value: sorted(value) if isinstance(value, (set, frozenset)) else str(value))
+
+class SharedRequestDirector:
+    def __init__(self, director):
+        self.director = director
+
+    def __getattr__(self, name):
+        return getattr(self.director, name)
+
+    def close(self):
+        # Owned by the HttpSession; closing one YoutubeDL must not tear down the others' connections
+        pass
+
+class HttpSession:
+    def __init__(self, cookie_file=COOKIE_FILE):
+        from yt_dlp.cookies import YoutubeDLCookieJar
+
+        self.cookie_file = str(cookie_file)
+        self.lock = threading.Lock()
+        self.owners = {}
+        self.cookiejar = YoutubeDLCookieJar(self.cookie_file)
+        if os.access(self.cookie_file, os.R_OK):
+            try:
+                self.cookiejar.load()
+            except Exception as e:
+                print(f"Ignoring unreadable cookie file {self.cookie_file}: {e}")
+
+    def _owner(self, params: Dict[str, Any]):
+        # A director logs through the YoutubeDL that built it, so build it from one that lives as long as the session
+        import yt_dlp
+
+        # auto_init=False skips registering extractors, which the owner never uses
+        owner = yt_dlp.YoutubeDL({**{name: params[name] for name in DIRECTOR_PARAMS if name in params},
+                                  'quiet': True, 'no_warnings': True}, auto_init=False)
+        owner.__dict__['cookiejar'] = self.cookiejar
+        return owner
+
+    def attach(self, ydl):
+        ydl.__dict__['cookiejar'] = self.cookiejar
+        key = director_key(ydl.params)
+        with self.lock:
+            owner = self.owners.get(key)
+            if owner is None:
+                owner = self.owners[key] = self._owner(ydl.params)
+            director = owner._request_director
+        ydl.__dict__['_request_director'] = SharedRequestDirector(director)
+        return ydl
+
+    def __len__(self):
+        return len(self.cookiejar)
+
+    def save(self):
+        with self.lock:
+            if not len(self.cookiejar) and not os.path.exists(self.cookie_file):
+                return
+            tmp_path = f"{self.cookie_file}.tmp"
+            self.cookiejar.save(tmp_path)
+            os.replace(tmp_path, self.cookie_file)
+
+    def close(self):
+        try:
+            self.save()
+        except OSError as e:
+            print(f"Could not save cookies to {self.cookie_file}: {e}")
+        with self.lock:
+            for owner in self.owners.values():
+                owner.close()
+            self.owners = {}
+
+_http_session = None
+_http_session_lock = threading.Lock()
+
+def get_http_session():
+    global _http_session
+    if not SESSION_CONFIG['enabled']:
+        return None
+    with _http_session_lock:
+        if _http_session is None:
+            _http_session = HttpSession(SESSION_CONFIG['cookie_file'])
+            atexit.register(_http_session.close)
+        return _http_session
+
+def open_ydl(options: Dict[str, Any]):
+    import yt_dlp
+
+    with tracer.span('ydl_init'):
+        ydl = yt_dlp.YoutubeDL(options)
+        session = get_http_session()
+        if session is not None:
+            session.attach(ydl)
+    return ydl
+
 def try_get_cookies():
+    session = get_http_session()
+    if session is None or not len(session):
+        return None
+    return session.cookie_file
+
+PERMANENT_FAILURE_PATTERNS = {
+    'private': ('private video', 'members-only', 'join this channel'),
+    'age_restricted': ('confirm your age', 'age-restricted', 'age restricted', 'inappropriate for some users'),
+    'geo_blocked': ('available in your country', 'blocked it in your country', 'geo restrict'),
+    'removed': ('video unavailable', 'has been removed', 'no longer available', 'account associated with this video',
+                'copyright', 'http error 404', 'http error 410'),
+    'unsupported': ('unsupported url', 'is not a valid url'),
+}
+
+def permanent_failure_class(error):
+    error_msg = str(error).lower()
+    for failure_class, patterns in PERMANENT_FAILURE_PATTERNS.items():
+        if any(pattern in error_msg for pattern in patterns):
+            return failure_class
     return None
 
-def add_delay(min_sec=1, max_sec=3):
-    time.sleep(random.uniform(min_sec, max_sec))
+def is_bot_detection(error):
+    # Private and age-gated videos also say "sign in", so only the explicit bot check counts
+    return 'not a bot' in str(error).lower() and permanent_failure_class(error) is None
 
-def get_channel_videos(channel_url: str, shorts_only: bool = True) -> List[Dict[str, Any]]:
+def is_throttle_error(error):
+    error_msg = str(error).lower()
+    if permanent_failure_class(error) is not None:
+        return False
+    return is_bot_detection(error) or 'http error 429' in error_msg or 'too many requests' in error_msg
+
+RATE_CONFIG = {
+    'rate': 1.0,
+    'min_rate': 0.1,
+    'max_rate': 10.0,
+    'rate_step': 0.1,
+    'max_concurrency': 64,
+    'pause': 30.0,
+    'max_pause': 900.0,
+    'max_pauses': 6,
+}
+MAX_THROTTLE_RETRIES = 5
+
+class RateLimitAborted(Exception):
+    pass
+
+def is_rate_limited(error):
+    return isinstance(error, RateLimitAborted) or is_throttle_error(error)
+
+class RateController:
+    def __init__(self, rate: float = 1.0, min_rate: float = 0.1, max_rate: float = 10.0, rate_step: float = 0.1,
+                 max_concurrency: int = 64, pause: float = 30.0, max_pause: float = 900.0, max_pauses: int = 6):
+        self.rate = rate
+        self.min_rate = min_rate
+        self.max_rate = max_rate
+        self.rate_step = rate_step
+        self.max_concurrency = max(1, max_concurrency)
+        self.concurrency = 1.0
+        self.active = 0
+        self.tokens = 1.0
+        self.updated = time.monotonic()
+        self.pause = pause
+        self.max_pause = max_pause
+        self.max_pauses = max_pauses
+        self.paused_until = 0.0
+        self.consecutive_pauses = 0
+        self.pauses = 0
+        self.aborted = False
+        self.cond = threading.Condition()
+
+    def _refill(self, now):
+        self.tokens = min(max(1.0, self.rate), self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def acquire(self, download: bool = False, stopped=None):
+        if not tracer.enabled:
+            return self._acquire(download, stopped)
+        with tracer.span('rate_wait', download=download):
+            return self._acquire(download, stopped)
+
+    def _acquire(self, download, stopped):
+        with self.cond:
+            while True:
+                if self.aborted:
+                    raise RateLimitAborted(f"Bot detection persisted after {self.pauses} pauses")
+                if stopped and stopped():
+                    return False
+                now = time.monotonic()
+                if now < self.paused_until:
+                    self.cond.wait(min(self.paused_until - now, 1.0))
+                    continue
+                if download and self.active >= int(self.concurrency):
+                    self.cond.wait(1.0)
+                    continue
+                self._refill(now)
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    if download:
+                        self.active += 1
+                    return True
+                self.cond.wait(min((1 - self.tokens) / self.rate, 1.0))
+
+    def reset(self):
+        # Each run gets its own allowance of pauses; a pause still in progress is kept
+        with self.cond:
+            self.aborted = False
+            self.consecutive_pauses = 0
+            self.cond.notify_all()
+
+    def release(self, download: bool = False):
+        with self.cond:
+            if download:
+                self.active -= 1
+            self.cond.notify_all()
+
+    def success(self):
+        with self.cond:
+            self.consecutive_pauses = 0
+            self.rate = min(self.max_rate, self.rate + self.rate_step)
+            self.concurrency = min(self.max_concurrency, self.concurrency + 1 / self.concurrency)
+            self.cond.notify_all()
+
+    def throttled(self, error):
+        metrics.inc('throttles')
+        if is_bot_detection(error):
+            metrics.inc('bot_detections')
+        with self.cond:
+            now = time.monotonic()
+            if now < self.paused_until:
+                return
+            self.rate = max(self.min_rate, self.rate / 2)
+            self.concurrency = max(1.0, self.concurrency / 2)
+            self.tokens = 0.0
+            self.consecutive_pauses += 1
+            self.pauses += 1
+            if self.consecutive_pauses > self.max_pauses:
+                self.aborted = True
+                self.cond.notify_all()
+                log(f"Still blocked after {self.max_pauses} pauses, stopping to avoid further detection")
+                return
+            pause = min(self.max_pause, self.pause * 2 ** (self.consecutive_pauses - 1))
+            self.paused_until = now + pause
+            self.cond.notify_all()
+        reason = str(error).strip().splitlines()[0][:120] if str(error).strip() else type(error).__name__
+        log(f"Throttled by YouTube ({reason})")
+        log(f"Pausing all requests for {pause:.0f}s, then resuming at {self.rate:.2f} requests/s")
+
+_rate_controller = None
+_rate_controller_lock = threading.Lock()
+
+def get_rate_controller() -> RateController:
+    global _rate_controller
+    with _rate_controller_lock:
+        if _rate_controller is None:
+            _rate_controller = RateController(**RATE_CONFIG)
+        return _rate_controller
+
+def call_with_backoff(fn, *args, stopped=None, **kwargs):
+    controller = get_rate_controller()
+    throttles = 0
+    while True:
+        if not controller.acquire(stopped=stopped):
+            return None
+        try:
+            result = fn(*args, **kwargs)
+        except Exception as e:
+            if is_throttle_error(e) and throttles < MAX_THROTTLE_RETRIES:
+                throttles += 1
+                controller.throttled(e)
+                metrics.inc('retries')
+                continue
+            raise
+        controller.success()
+        return result
+
+POSTPROCESS_CONFIG = {
+    'workers': max(1, (os.cpu_count() or 2) // 2),
+}
+TRANSCODE_AUDIO_BITRATE = 128 * 1000
+TRANSCODE_MIN_VIDEO_BITRATE = 100 * 1000
+TRANSCODE_CODECS = {
+    'webm': ('libvpx-vp9', 'libopus'),
+}
+
+def temp_output_path(path: str) -> str:
+    root, ext = os.path.splitext(path)
+    return f"{root}.temp{ext}"
+
+def budget_video_bitrate(budget: int, duration: float) -> int:
+    total = budget * 8 * 0.95 / duration
+    return max(TRANSCODE_MIN_VIDEO_BITRATE, int(total - TRANSCODE_AUDIO_BITRATE))
+
+class PostprocessPool:
+    def __init__(self, workers: int, ffmpeg: str):
+        self.ffmpeg = ffmpeg
+        self.executor = ThreadPoolExecutor(max_workers=max(1, workers))
+        self.lock = threading.Lock()
+        self.queued = 0
+        metrics.track('postprocess_queue_depth', self._queued_count)
+
+    def _queued_count(self):
+        return self.queued
+
+    def submit(self, fn, *args):
+        with self.lock:
+            self.queued += 1
+        return self.executor.submit(self._run, fn, *args)
+
+    def _run(self, fn, *args):
+        with self.lock:
+            self.queued -= 1
+        return fn(*args)
+
+    def run_ffmpeg(self, args: List[str]):
+        with tracer.span('ffmpeg', output=os.path.basename(args[-1])):
+            result = subprocess.run([self.ffmpeg, '-y', '-hide_banner', '-loglevel', 'error', *args],
+                                    stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, universal_newlines=True)
+        if result.returncode != 0:
+            raise RuntimeError(f"ffmpeg failed: {(result.stderr.strip().splitlines() or ['unknown error'])[-1]}")
+
+    def merge(self, parts: List[str], output: str):
+        tmp_path = temp_output_path(output)
+        inputs = [arg for part in parts for arg in ('-i', part)]
+        maps = [arg for i in range(len(parts)) for arg in ('-map', str(i))]
+        self.run_ffmpeg([*inputs, *maps, '-c', 'copy', tmp_path])
+        os.replace(tmp_path, output)
+        for part in parts:
+            with contextlib.suppress(OSError):
+                os.remove(part)
+
+    def transcode(self, path: str, budget: int, duration: float):
+        video_codec, audio_codec = TRANSCODE_CODECS.get(path.rsplit('.', 1)[-1], ('libx264', 'aac'))
+        bitrate = budget_video_bitrate(budget, duration)
+        tmp_path = temp_output_path(path)
+        self.run_ffmpeg(['-i', path, '-c:v', video_codec, '-b:v', str(bitrate), '-maxrate', str(bitrate),
+                         '-bufsize', str(bitrate * 2), '-c:a', audio_codec, '-b:a', str(TRANSCODE_AUDIO_BITRATE),
+                         tmp_path])
+        os.replace(tmp_path, path)
+        metrics.inc('transcodes')
+
+    def close(self):
+        self.executor.shutdown(wait=True)
+        metrics.untrack('postprocess_queue_depth', self._queued_count)
+
+_postprocess_pool = None
+_postprocess_pool_lock = threading.Lock()
+
+def get_postprocess_pool():
+    global _postprocess_pool
+    if POSTPROCESS_CONFIG['workers'] <= 0:
+        return None
+    with _postprocess_pool_lock:
+        if _postprocess_pool is None:
+            ffmpeg = shutil.which('ffmpeg')
+            if ffmpeg is None:
+                POSTPROCESS_CONFIG['workers'] = 0
+                return None
+            _postprocess_pool = PostprocessPool(POSTPROCESS_CONFIG['workers'], ffmpeg)
+            atexit.register(_postprocess_pool.close)
+        return _postprocess_pool
+
+class DownloadPool:
+    def __init__(self, download_opts: Dict[str, Any], workers: int = 1, limiter: threading.Semaphore = None,
+                 cancel_event: threading.Event = None, size_budget: int = None, layout: 'OutputLayout' = None):
+        self.workers = max(1, int(workers))
+        self.limiter = limiter
+        self.cancel_event = cancel_event
+        self.size_budget = size_budget
+        self.layout = layout
+        self.postprocessor = get_postprocess_pool()
+        self.postprocessing = []
+        self.download_opts = {
+            **download_opts,
+            'ignoreerrors': False,
+            'progress_hooks': [*download_opts.get('progress_hooks', []), metrics.progress_hook, self._progress_hook],
+            'postprocessor_hooks': [*download_opts.get('postprocessor_hooks', []), metrics.postprocessor_hook],
+        }
+        if self.workers > 1:
+            self.download_opts['quiet'] = True
+            self.download_opts['noprogress'] = True
+        self.executor = ThreadPoolExecutor(max_workers=self.workers)
+        self.slots = threading.BoundedSemaphore(self.workers * 2)
+        self.local = threading.local()
+        self.lock = threading.Lock()
+        self.stop_event = threading.Event()
+        self.ydls = []
+        self.downloaded = 0
+        self.failed = 0
+        self.pending = 0
+        self.active = 0
+        self.bot_detected = False
+        metrics.track('download_queue_depth', self._pending_count)
+        metrics.track('downloads_active', self._active_count)
+
+    def _pending_count(self):
+        return self.pending
+
+    def _active_count(self):
+        return self.active
+
+    def _progress_hook(self, status):
+        if self.stopped:
+            from yt_dlp.utils import DownloadCancelled
+            raise DownloadCancelled('Stopped by user')
+
+    def _get_ydl(self):
+        ydl = getattr(self.local, 'ydl', None)
+        if ydl is None:
+            ydl = open_ydl(self.download_opts)
+            if self.layout and self.layout.scratch_dir:
+                ydl.add_post_processor(make_finalizer(self.layout), when='after_move')
+            if get_library():
+                ydl.add_post_processor(make_library_recorder(), when='after_move')
+            self.local.ydl = ydl
+            with self.lock:
+                self.ydls.append(ydl)
+        return ydl
+
+    @property
+    def stopped(self):
+        return self.stop_event.is_set() or (self.cancel_event is not None and self.cancel_event.is_set())
+
+    def submit(self, url: str, label: str = "", on_success=None, on_failure=None):
+        if self.stopped:
+            return False
+        self.slots.acquire()
+        if self.stopped:
+            self.slots.release()
+            return False
+        with self.lock:
+            self.pending += 1
+        future = self.executor.submit(self._run, url, label, on_success, on_failure)
+        future.add_done_callback(lambda f: self.slots.release())
+        return True
+
+    def _download(self, url):
+        if self.limiter is None:
+            return self._timed_download(url) or True
+        with self.limiter:
+            if self.stopped:
+                return False
+            return self._timed_download(url) or True
+
+    def _timed_download(self, url):
+        with self.lock:
+            self.active += 1
+        try:
+            with metrics.timer('download', url=url):
+                return self._fetch(self._get_ydl(), url)
+        finally:
+            with self.lock:
+                self.active -= 1
+
+    def _fetch(self, ydl, url):
+        if self.postprocessor is None:
+            with tracer.span('transfer'):
+                ydl.download([url])
+            return None
+        
+        with tracer.span('extract_info'):
+            info = ydl.extract_info(url, download=False)
+        if info.get('_type', 'video') != 'video':
+            # Playlists and channels in a link file: let yt-dlp walk and download the entries itself
+            with tracer.span('transfer'):
+                ydl.download([url])
+            return None
+        formats = info.get('requested_formats')
+        if not formats:
+            with tracer.span('transfer', format=info.get('format_id')):
+                ydl.process_info(info)
+            path = info.get('filepath')
+            if self.size_budget and path:
+                return lambda: self._fit_budget(path, info)
+            return None
+        
+        from yt_dlp.utils import DownloadError
+        output = ydl.prepare_filename(info)
+        final_output = self.layout.final_path(output) if self.layout else output
+        if not ydl.params.get('overwrites') and os.path.exists(final_output):
+            ydl.to_screen(f"[download] {final_output} has already been downloaded")
+            return None
+        os.makedirs(os.path.dirname(output) or '.', exist_ok=True)
+        parts = []
+        for fmt in formats:
+            part_info = {**info, **fmt}
+            part_info.pop('requested_formats', None)
+            part = f"{os.path.splitext(output)[0]}.f{fmt['format_id']}.{fmt['ext']}"
+            with tracer.span('transfer', format=fmt['format_id']):
+                success, _ = ydl.dl(part, part_info)
+            if not success:
+                raise DownloadError(f"Downloading format {fmt['format_id']} failed")
+            parts.append(part)
+        return lambda: self._merge(parts, output, info)
+
+    def _merge(self, parts, output, info):
+        self.postprocessor.merge(parts, output)
+        if self.size_budget and info.get('duration') and os.path.getsize(output) > self.size_budget:
+            self.postprocessor.transcode(output, self.size_budget, info['duration'])
+        if self.layout:
+            output = self.layout.finalize(output)
+        record_download(output, info)
+
+    def _fit_budget(self, path, info):
+        if self.size_budget and info.get('duration') and os.path.getsize(path) > self.size_budget:
+            self.postprocessor.transcode(path, self.size_budget, info['duration'])
+            record_download(path, info)
+
+    def _run(self, url, label, on_success, on_failure):
+        with self.lock:
+            self.pending -= 1
+        if self.stopped:
+            return
+        with tracer.span('video', **trace_video_args(url, label)):
+            self._attempt(url, label, on_success, on_failure)
+
+    def _attempt(self, url, label, on_success, on_failure):
+        controller = get_rate_controller()
+        if self.workers == 1:
+            log(f"\n{label} Downloading: {url}".replace("\n ", "\n"))
+        else:
+            log(f"{label} Downloading: {url}".strip())
+        
+        throttles = 0
+        while True:
+            try:
+                if not controller.acquire(download=True, stopped=lambda: self.stopped):
+                    return
+                try:
+                    result = self._download(url)
+                    if not result:
+                        return
+                finally:
+                    controller.release(download=True)
+                controller.success()
+                break
+            except RateLimitAborted as e:
+                with self.lock:
+                    self.failed += 1
+                metrics.inc('downloads_failed')
+                self.bot_detected = True
+                self.stop_event.set()
+                self._notify(label, on_failure, e)
+                return
+            except Exception as e:
+                if self.stopped:
+                    return
+                if classify_failure(e) == 'throttle' and throttles < MAX_THROTTLE_RETRIES:
+                    throttles += 1
+                    controller.throttled(e)
+                    metrics.inc('retries')
+                    continue
+                with self.lock:
+                    self.failed += 1
+                metrics.inc('downloads_failed')
+                log(f"{label} Download failed: {e}".strip())
+                self._notify(label, on_failure, e)
+                return
+
+        if callable(result):
+            future = self.postprocessor.submit(self._postprocess, result, label, on_success, on_failure)
+            with self.lock:
+                self.postprocessing.append(future)
+            return
+        self._finish(label, on_success)
+
+    def _postprocess(self, task, label, on_success, on_failure):
+        try:
+            with metrics.timer('postprocess', label=label.strip('[]')):
+                task()
+        except Exception as e:
+            with self.lock:
+                self.failed += 1
+            metrics.inc('downloads_failed')
+            log(f"{label} Post-processing failed: {e}".strip())
+            self._notify(label, on_failure, e)
+            return
+        self._finish(label, on_success)
+
+    def _finish(self, label, on_success):
+        with self.lock:
+            self.downloaded += 1
+        metrics.inc('downloads_completed')
+        log(f"{label} Downloaded successfully!".strip())
+        self._notify(label, on_success)
+
+    def _notify(self, label, callback, *args):
+        if callback:
+            try:
+                callback(*args)
+            except Exception as e:
+                log(f"{label} Post-download step failed: {e}".strip())
+
+    @property
+    def bytes_saved(self):
+        return getattr(self.download_opts.get('format'), 'bytes_saved', None)
+
+    def stop(self):
+        self.stop_event.set()
+
+    def close(self):
+        self.executor.shutdown(wait=True)
+        wait(self.postprocessing)
+        self.postprocessing = []
+        for ydl in self.ydls:
+            ydl.close()
+        self.ydls = []
+        metrics.untrack('download_queue_depth', self._pending_count)
+        metrics.untrack('downloads_active', self._active_count)
+
+ChannelVideo = collections.namedtuple('ChannelVideo', ('url', 'title', 'duration', 'upload_date', 'view_count', 'id'))
+CHANNEL_CACHE_MAX_VIDEOS = 20000
+
+def iter_channel_videos(channel_url: str, shorts_only: bool = True):
+    get_rate_controller().reset()
     try:
         import yt_dlp
         
         base_opts = get_yt_dlp_options()
         cookies = try_get_cookies()
         
-        if cookies:
-            base_opts['cookiesfrombrowser'] = cookies
-        
-        if shorts_only:
-            base_opts['match_filter'] = lambda info: None if (info.get('duration') and 0 < info.get('duration') <= 60) else "Not a short"
-        
         ydl_opts = {
             **base_opts,
             'quiet': False,
             'no_warnings': False,
-            'extract_flat': False,
+            'extract_flat': True,
+            'ignoreerrors': False,
         }
         
+        video_type = "shorts" if shorts_only else "videos"
+        cache = get_metadata_cache()
+        cache_key = f"{video_type}:{channel_url}"
+        if cache:
+            cached = cache.get('channel', cache_key)
+            if cached is not None:
+                print(f"Loaded {len(cached)} {video_type} from metadata cache")
+                for item in cached:
+                    yield ChannelVideo(**item) if isinstance(item, dict) else ChannelVideo(*item)
+                return
+        
         print(f"Using bot detection bypass...")
         if cookies:
-            print(f"Using browser cookies for authentication")
+            print(f"Using cookies from {cookies}")
         else:
             print(f"No cookies available - using anonymous access")
         
-        with yt_dlp.YoutubeDL(ydl_opts) as ydl:
-            video_type = "shorts" if shorts_only else "videos"
+        with open_ydl(ydl_opts) as ydl:
             print(f"Fetching {video_type} from: {channel_url}")
             
             try:
-                add_delay(2, 4)
-                channel_info = ydl.extract_info(channel_url, download=False)
+                channel_info, scan_url = open_channel_scan(ydl, channel_url, shorts_only)
             except Exception as e:
-                error_msg = str(e).lower()
-                if 'sign in' in error_msg or 'bot' in error_msg or 'cookies' in error_msg:
+                if is_rate_limited(e) or 'cookies' in str(e).lower():
                     print(f"YouTube bot detection triggered!")
                     print(f"SOLUTIONS:")
                     print(f"  1. Wait 10-15 minutes before trying again")
                     print(f"  2. Try a smaller/different channel")
                     print(f"  3. Use a VPN to change your IP address")
-                    return []
+                    return
                 else:
                     print(f"Failed to fetch channel info: {e}")
                     print("Try using a different channel URL format:")
                     print("  - https://youtube.com/@channelname")
                     print("  - https://youtube.com/c/channelname")
-                    return []
+                    return
+
+            if not channel_info or 'entries' not in channel_info:
+                print("No videos found in channel or invalid channel")
+                return
+            
+            from_shorts_tab = shorts_only and is_shorts_url(scan_url)
+            scan_stream = EntryStream(iter_channel_entries(channel_info, scan_url))
+            channel_info = None
+            cache_rows = [] if cache else None
+            try:
+                for entry in scan_stream:
+                    keep = prefilter_entry(entry, shorts_only, from_shorts_tab)
+                    if keep is False:
+                        continue
+                    
+                    video_info = entry
+                    if keep is None or not entry.get('upload_date'):
+                        video_info = probe_video(entry['url'], entry.get('id')) or entry
+                    if keep is None and not is_short_duration(video_info.get('duration')):
+                        continue
+                    
+                    video = ChannelVideo(
+                        url=video_info.get('webpage_url') or entry.get('url', ''),
+                        title=video_info.get('title') or entry.get('title') or 'Unknown',
+                        duration=video_info.get('duration') or entry.get('duration') or 0,
+                        upload_date=video_info.get('upload_date') or 'Unknown',
+                        view_count=video_info.get('view_count') or entry.get('view_count') or 0,
+                        id=video_info.get('id') or entry.get('id', ''),
+                    )
+                    video_info = entry = None
+                    if cache_rows is not None:
+                        cache_rows.append(video)
+                        if len(cache_rows) > CHANNEL_CACHE_MAX_VIDEOS:
+                            cache_rows = None
+                    yield video
+                completed = scan_stream.finished
+            finally:
+                scan_stream.close()
+            
+            if cache_rows and completed:
+                cache.put('channel', cache_key, [list(video) for video in cache_rows])
+            
+    except KeyboardInterrupt:
+        print(f"\nOperation cancelled by user")
+    except Exception as e:
+        print(f"Critical error: {e}")
+
+def get_channel_videos(channel_url: str, shorts_only: bool = True) -> List[Dict[str, Any]]:
+    video_type = "shorts" if shorts_only else "videos"
+    videos = [video._asdict() for video in iter_channel_videos(channel_url, shorts_only)]
+    if videos:
+        print(f"Found {len(videos)} {video_type}")
+    else:
+        print(f"No {video_type} found in this channel")
+    return videos
+
+LEDGER_FILE = 'downloaded_videos.jsonl'
+LEGACY_LOG_FILE = 'downloaded_videos.json'
+
+def iter_ledger(path=LEDGER_FILE):
+    path = Path(path)
+    if not path.exists():
+        return
+    with open(path, 'r') as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                yield json.loads(line)
+            except ValueError:
+                continue
+
+def count_ledger(path=LEDGER_FILE):
+    path = Path(path)
+    if not path.exists():
+        return 0
+    count = 0
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b''):
+            count += chunk.count(b'\n')
+    return count
+
+def repair_ledger_tail(path=LEDGER_FILE):
+    path = Path(path)
+    if not path.exists():
+        return 0
+    with open(path, 'rb+') as f:
+        end = f.seek(0, os.SEEK_END)
+        if end == 0:
+            return 0
+        f.seek(end - 1)
+        if f.read(1) == b'\n':
+            return 0
+        # A crash mid-append left a partial record; cut back to the last complete line
+        position = end
+        while position > 0:
+            start = max(0, position - 64 * 1024)
+            f.seek(start)
+            newline = f.read(position - start).rfind(b'\n')
+            if newline != -1:
+                position = start + newline + 1
+                break
+            position = start
+        f.truncate(position)
+        f.flush()
+        os.fsync(f.fileno())
+    log(f"Dropped {end - position} bytes of an incomplete record at the end of {path}")
+    return end - position
+
+def migrate_legacy_log(ledger_path=LEDGER_FILE, legacy_path=LEGACY_LOG_FILE):
+    legacy = Path(legacy_path)
+    if not legacy.exists():
+        return 0
+    
+    try:
+        with open(legacy, 'r') as f:
+            records = json.load(f)
+    except ValueError as e:
+        print(f"Could not migrate {legacy}: {e}")
+        return 0
+    
+    known = {record.get('id') for record in iter_ledger(ledger_path)}
+    migrated = 0
+    with open(ledger_path, 'a') as f:
+        for record in records:
+            if record.get('id') and record.get('id') in known:
+                continue
+            f.write(json.dumps(record) + '\n')
+            migrated += 1
+        f.flush()
+        os.fsync(f.fileno())
+    
+    legacy.rename(legacy.with_name(legacy.name + '.migrated'))
+    print(f"Migrated {migrated} entries from {legacy} to {ledger_path}")
+    return migrated
+
+class DownloadLedger:
+    def __init__(self, path=LEDGER_FILE, fsync_every: int = 20, fsync_interval: float = 5.0):
+        self.path = Path(path)
+        self.fsync_every = fsync_every
+        self.fsync_interval = fsync_interval
+        self.lock = threading.Lock()
+        repair_ledger_tail(self.path)
+        migrate_legacy_log(self.path)
+        self.ids = {record.get('id') for record in iter_ledger(self.path) if record.get('id')}
+        self.file = open(self.path, 'a')
+        self.pending = 0
+        self.last_sync = time.time()
+
+    def __contains__(self, video_id):
+        return video_id in self.ids
+
+    def __len__(self):
+        return len(self.ids)
+
+    def append(self, video_data: Dict[str, Any]):
+        line = json.dumps(video_data) + '\n'
+        with tracer.span('ledger_write'), self.lock:
+            self.file.write(line)
+            self.file.flush()
+            if video_data.get('id'):
+                self.ids.add(video_data['id'])
+            self.pending += 1
+            if self.pending >= self.fsync_every or time.time() - self.last_sync >= self.fsync_interval:
+                self._sync()
+
+    def _sync(self):
+        with tracer.span('ledger_fsync'):
+            os.fsync(self.file.fileno())
+        self.pending = 0
+        self.last_sync = time.time()
+
+    def sync(self):
+        with self.lock:
+            if self.pending and not self.file.closed:
+                self._sync()
+
+    def close(self):
+        with self.lock:
+            if self.file.closed:
+                return
+            if self.pending:
+                self._sync()
+            self.file.close()
+
+_ledger = None
+_ledger_lock = threading.Lock()
+
+def get_ledger() -> DownloadLedger:
+    global _ledger
+    with _ledger_lock:
+        if _ledger is None:
+            _ledger = DownloadLedger()
+            atexit.register(_ledger.close)
+        return _ledger
+
+QUEUE_FILE = 'ytd_queue.sqlite'
+QUEUE_CONFIG = {
+    'path': None,
+    'lease': 300.0,
+}
+QUEUE_POLL_INTERVAL = 1.0
+RETRY_FILE = 'ytd_retry.sqlite'
+RETRY_CONFIG = {
+    'enabled': True,
+    'path': RETRY_FILE,
+    'max_attempts': 5,
+    'base_delay': 60.0,
+    'max_delay': 6 * 3600.0,
+}
+
+def classify_failure(error) -> str:
+    failure_class = permanent_failure_class(error)
+    if failure_class:
+        return failure_class
+    if is_rate_limited(error):
+        return 'throttle'
+    return 'transient'
+
+def is_permanent_failure(failure_class: str) -> bool:
+    return failure_class in PERMANENT_FAILURE_PATTERNS
+
+def retry_delay(attempts: int) -> float:
+    delay = min(RETRY_CONFIG['max_delay'], RETRY_CONFIG['base_delay'] * 2 ** max(0, attempts - 1))
+    return delay * random.uniform(0.5, 1.5)
+
+def queue_name_for(job: Dict[str, Any]) -> str:
+    if job.get('file'):
+        return f"file:{os.path.abspath(job['file'])}"
+    return f"{job.get('mode', 'shorts')}:{job['channel']}"
+
+CLAIMABLE_ITEM = "((status = 'pending' AND next_attempt <= ?) OR (status = 'leased' AND lease_until < ?))"
+
+class WorkQueue:
+    def __init__(self, path=QUEUE_FILE, lease: float = 300.0):
+        self.path = str(path)
+        self.lease = lease
+        self.owner = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self.lock = threading.Lock()
+        self.db = sqlite3.connect(self.path, timeout=60, isolation_level=None, check_same_thread=False)
+        # WAL relies on shared memory, which does not work across machines on a shared filesystem
+        self.db.execute('PRAGMA journal_mode=DELETE')
+        with self._transaction():
+            self.db.execute("""
+                CREATE TABLE IF NOT EXISTS queues (
+                    name TEXT PRIMARY KEY,
+                    spec TEXT NOT NULL,
+                    created REAL NOT NULL
+                )""")
+            self.db.execute("""
+                CREATE TABLE IF NOT EXISTS items (
+                    id INTEGER PRIMARY KEY,
+                    queue TEXT NOT NULL,
+                    url TEXT NOT NULL,
+                    label TEXT,
+                    data TEXT,
+                    status TEXT NOT NULL DEFAULT 'pending',
+                    owner TEXT,
+                    lease_until REAL,
+                    attempts INTEGER NOT NULL DEFAULT 0,
+                    error TEXT,
+                    error_class TEXT,
+                    next_attempt REAL NOT NULL DEFAULT 0,
+                    updated REAL NOT NULL,
+                    UNIQUE (queue, url)
+                )""")
+            columns = {row[1] for row in self.db.execute('PRAGMA table_info(items)')}
+            if 'error_class' not in columns:
+                self.db.execute('ALTER TABLE items ADD COLUMN error_class TEXT')
+            if 'next_attempt' not in columns:
+                self.db.execute('ALTER TABLE items ADD COLUMN next_attempt REAL NOT NULL DEFAULT 0')
+            self.db.execute('CREATE INDEX IF NOT EXISTS items_claim ON items (queue, status, lease_until)')
+
+    @contextlib.contextmanager
+    def _transaction(self):
+        with self.lock:
+            self.db.execute('BEGIN IMMEDIATE')
+            try:
+                yield
+            except BaseException:
+                self.db.execute('ROLLBACK')
+                raise
+            self.db.execute('COMMIT')
+
+    def create(self, name: str, spec: Dict[str, Any]):
+        with self._transaction():
+            self.db.execute('INSERT OR REPLACE INTO queues (name, spec, created) VALUES (?, ?, ?)',
+                            (name, json.dumps(spec), time.time()))
+
+    def spec(self, name: str):
+        with self.lock:
+            row = self.db.execute('SELECT spec FROM queues WHERE name = ?', (name,)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def enqueue(self, name: str, url: str, label: str = "", data: Dict[str, Any] = None) -> bool:
+        return self.enqueue_many(name, [(url, label, data)]) > 0
+
+    def enqueue_many(self, name: str, items) -> int:
+        now = time.time()
+        with self._transaction():
+            cursor = self.db.executemany(
+                'INSERT OR IGNORE INTO items (queue, url, label, data, updated) VALUES (?, ?, ?, ?, ?)',
+                [(name, url, label, json.dumps(data) if data is not None else None, now) for url, label, data in items])
+        return cursor.rowcount
+
+    def claim(self, name: str, limit: int = 1) -> List[Dict[str, Any]]:
+        now = time.time()
+        with self._transaction():
+            rows = self.db.execute(
+                f"SELECT id, url, label, data, status FROM items WHERE queue = ? AND {CLAIMABLE_ITEM} ORDER BY id LIMIT ?",
+                (name, now, now, limit)).fetchall()
+            self.db.executemany(
+                "UPDATE items SET status = 'leased', owner = ?, lease_until = ?, attempts = attempts + 1, updated = ? "
+                "WHERE id = ?", [(self.owner, now + self.lease, now, row[0]) for row in rows])
+        reclaimed = sum(1 for row in rows if row[4] == 'leased')
+        if reclaimed:
+            metrics.inc('queue_leases_reclaimed', reclaimed)
+        return [{'id': item_id, 'url': url, 'label': label or "", 'data': json.loads(data) if data else None}
+                for item_id, url, label, data, _ in rows]
+
+    def heartbeat(self, item_ids) -> int:
+        item_ids = list(item_ids)
+        if not item_ids:
+            return 0
+        now = time.time()
+        with self._transaction():
+            cursor = self.db.execute(
+                f"UPDATE items SET lease_until = ?, updated = ? WHERE owner = ? AND status = 'leased' "
+                f"AND id IN ({', '.join('?' * len(item_ids))})", (now + self.lease, now, self.owner, *item_ids))
+        return cursor.rowcount
+
+    def complete(self, item_id: int):
+        with self._transaction():
+            self.db.execute("UPDATE items SET status = 'done', owner = NULL, lease_until = NULL, error = NULL, "
+                            "error_class = NULL, updated = ? WHERE id = ? AND owner = ? AND status = 'leased'",
+                            (time.time(), item_id, self.owner))
+
+    def fail(self, item_id: int, error) -> str:
+        with self._transaction():
+            row = self.db.execute("SELECT attempts FROM items WHERE id = ? AND owner = ? AND status = 'leased'",
+                                  (item_id, self.owner)).fetchone()
+            if row is None:
+                return None
+            return self._reschedule(item_id, row[0], error)
+
+    def record_failure(self, name: str, url: str, label: str, data: Dict[str, Any], error) -> str:
+        with self._transaction():
+            row = self.db.execute('SELECT id, attempts FROM items WHERE queue = ? AND url = ?', (name, url)).fetchone()
+            if row is None:
+                item_id = self.db.execute(
+                    'INSERT INTO items (queue, url, label, data, updated) VALUES (?, ?, ?, ?, ?)',
+                    (name, url, label, json.dumps(data) if data is not None else None, time.time())).lastrowid
+                attempts = 1
+            else:
+                item_id, attempts = row[0], row[1] + 1
+            self.db.execute('UPDATE items SET attempts = ? WHERE id = ?', (attempts, item_id))
+            return self._reschedule(item_id, attempts, error)
+
+    def _reschedule(self, item_id: int, attempts: int, error) -> str:
+        failure_class = classify_failure(error)
+        now = time.time()
+        if is_permanent_failure(failure_class) or attempts >= RETRY_CONFIG['max_attempts']:
+            status, next_attempt = 'failed', 0
+        else:
+            status, next_attempt = 'pending', now + retry_delay(attempts)
+        self.db.execute("UPDATE items SET status = ?, owner = NULL, lease_until = NULL, error = ?, error_class = ?, "
+                        "next_attempt = ?, updated = ? WHERE id = ?",
+                        (status, str(error), failure_class, next_attempt, now, item_id))
+        return status
+
+    def release(self, name: str = None):
+        query = "UPDATE items SET status = 'pending', owner = NULL, lease_until = NULL WHERE owner = ? AND status = 'leased'"
+        params = (self.owner,)
+        if name is not None:
+            query += ' AND queue = ?'
+            params += (name,)
+        with self._transaction():
+            return self.db.execute(query, params).rowcount
+
+    def has_claimable(self, name: str) -> bool:
+        with self.lock:
+            now = time.time()
+            return self.db.execute(f"SELECT 1 FROM items WHERE queue = ? AND {CLAIMABLE_ITEM} LIMIT 1",
+                                   (name, now, now)).fetchone() is not None
+
+    def claimable_queues(self) -> List[str]:
+        with self.lock:
+            now = time.time()
+            rows = self.db.execute(f"SELECT DISTINCT queue FROM items WHERE {CLAIMABLE_ITEM}", (now, now)).fetchall()
+        return [row[0] for row in rows]
+
+    def next_retry(self):
+        with self.lock:
+            return self.db.execute("SELECT MIN(next_attempt) FROM items WHERE status = 'pending' AND next_attempt > ?",
+                                   (time.time(),)).fetchone()[0]
+
+    def counts_all(self) -> Dict[str, int]:
+        with self.lock:
+            return dict(self.db.execute('SELECT status, COUNT(*) FROM items GROUP BY status').fetchall())
+
+    def counts(self, name: str) -> Dict[str, int]:
+        with self.lock:
+            rows = self.db.execute('SELECT status, COUNT(*) FROM items WHERE queue = ? GROUP BY status', (name,)).fetchall()
+        return dict(rows)
+
+    def close(self):
+        with self.lock:
+            try:
+                self.db.execute("UPDATE items SET status = 'pending', owner = NULL, lease_until = NULL "
+                                "WHERE owner = ? AND status = 'leased'", (self.owner,))
+            except sqlite3.Error:
+                pass
+            self.db.close()
+
+_work_queue = None
+_work_queue_lock = threading.Lock()
+
+def get_work_queue():
+    global _work_queue
+    if not QUEUE_CONFIG['path']:
+        return None
+    with _work_queue_lock:
+        if _work_queue is None:
+            _work_queue = WorkQueue(QUEUE_CONFIG['path'], QUEUE_CONFIG['lease'])
+            atexit.register(_work_queue.close)
+        return _work_queue
+
+_retry_queue = None
+
+def get_retry_queue():
+    global _retry_queue
+    if not RETRY_CONFIG['enabled']:
+        return None
+    with _work_queue_lock:
+        if _retry_queue is None:
+            try:
+                _retry_queue = WorkQueue(RETRY_CONFIG['path'], QUEUE_CONFIG['lease'])
+            except sqlite3.Error as e:
+                print(f"Retry queue unavailable: {e}")
+                RETRY_CONFIG['enabled'] = False
+                return None
+            atexit.register(_retry_queue.close)
+        return _retry_queue
+
+def make_failure_recorder(job: Dict[str, Any]):
+    name = queue_name_for(job)
+    created = threading.Event()
+    
+    def record(url: str, label: str, data: Dict[str, Any], error):
+        retry_queue = get_retry_queue()
+        if retry_queue is None:
+            return
+        if not created.is_set():
+            retry_queue.create(name, job_to_spec(job))
+            created.set()
+        if retry_queue.record_failure(name, url, label, data, error) == 'pending':
+            metrics.inc('retries_scheduled')
+    
+    return record
+
+def format_queue_counts(counts: Dict[str, int]) -> str:
+    return ", ".join(f"{counts.get(status, 0)} {status}" for status in ('pending', 'leased', 'done', 'failed'))
+
+class QueueRunner:
+    def __init__(self, work_queue: WorkQueue, name: str, pool: 'DownloadPool', on_failure=None):
+        self.queue = work_queue
+        self.name = name
+        self.pool = pool
+        self.on_failure = on_failure
+        self.lock = threading.Lock()
+        self.in_flight = set()
+        self.producing = threading.Event()
+        self.wakeup = threading.Event()
+        self.thread = None
+
+    def put(self, url: str, label: str = "", data: Dict[str, Any] = None) -> bool:
+        return self.put_many([(url, label, data)]) > 0
+
+    def put_many(self, items) -> int:
+        added = self.queue.enqueue_many(self.name, items)
+        self.wakeup.set()
+        return added
+
+    def start(self, producing: bool = True):
+        if producing:
+            self.producing.set()
+        self.thread = threading.Thread(target=self.drain, daemon=True)
+        self.thread.start()
+        return self
+
+    def finish(self):
+        self.producing.clear()
+        self.wakeup.set()
+        if self.thread:
+            self.thread.join()
+
+    def drain(self):
+        capacity = self.pool.workers * 2
+        last_heartbeat = time.time()
+        while not self.pool.stopped:
+            if time.time() - last_heartbeat >= self.queue.lease / 3:
+                with self.lock:
+                    in_flight = list(self.in_flight)
+                self.queue.heartbeat(in_flight)
+                last_heartbeat = time.time()
+            with self.lock:
+                free = capacity - len(self.in_flight)
+            items = self.queue.claim(self.name, free) if free > 0 else []
+            if not items:
+                with self.lock:
+                    idle = not self.in_flight
+                if idle and not self.producing.is_set() and not self.queue.has_claimable(self.name):
+                    break
+                self.wakeup.wait(QUEUE_POLL_INTERVAL)
+                self.wakeup.clear()
+                continue
+            for item in items:
+                with self.lock:
+                    self.in_flight.add(item['id'])
+                if not self.pool.submit(item['url'], item['label'],
+                                        on_success=lambda item=item: self._complete(item),
+                                        on_failure=lambda error, item=item: self._fail(item, error)):
+                    return
+
+    def _settled(self, item):
+        with self.lock:
+            self.in_flight.discard(item['id'])
+        self.wakeup.set()
+
+    def _complete(self, item):
+        try:
+            if item['data']:
+                get_ledger().append(item['data'])
+            self.queue.complete(item['id'])
+        finally:
+            self._settled(item)
+
+    def _fail(self, item, error):
+        try:
+            if self.on_failure:
+                self.on_failure(item, error)
+            if self.queue.fail(item['id'], error) == 'pending':
+                log(f"{item['label']} Will retry later ({classify_failure(error)} failure)".strip())
+        finally:
+            self._settled(item)
+
+    def close(self):
+        self.queue.release(self.name)
+
+VIDEO_ID_PATTERN = re.compile(r'\[([0-9A-Za-z_-]+)\]\.\w+$')
+PARTIAL_SUFFIXES = ('.part', '.ytdl')
+
+def iter_files(directory: str):
+    with os.scandir(directory) as entries:
+        for entry in entries:
+            if entry.is_dir(follow_symlinks=False):
+                yield from iter_files(entry.path)
+            else:
+                yield entry
+
+def scan_output_dir_ids(output_dir: str):
+    complete = set()
+    partial = set()
+    if not Path(output_dir).is_dir():
+        return complete, partial
+    
+    for entry in iter_files(output_dir):
+        name = entry.name
+        is_partial = False
+        if '.part-Frag' in name:
+            name = name[:name.index('.part-Frag')]
+            is_partial = True
+        elif name.endswith(PARTIAL_SUFFIXES):
+            name = name.rsplit('.', 1)[0]
+            is_partial = True
+        match = VIDEO_ID_PATTERN.search(name)
+        if match:
+            (partial if is_partial else complete).add(match.group(1))
+    
+    return complete, partial
+
+def collect_known_ids(output_dir: str, ledger: DownloadLedger = None, scratch_dir: str = None):
+    complete, partial = scan_output_dir_ids(output_dir)
+    if scratch_dir:
+        partial |= scan_output_dir_ids(scratch_dir)[1]
+    if ledger is not None:
+        complete |= ledger.ids
+    return complete - partial, partial
+
+OUTPUT_FILENAME = '%(title)s [%(id)s].%(ext)s'
+OUTPUT_LAYOUTS = {
+    'flat': '',
+    'id': '%(id.0:2)s/',
+    'channel': '%(channel_id,uploader_id|unknown)s/%(upload_date>%Y|unknown)s/',
+}
+
+class OutputLayout:
+    def __init__(self, output_dir: str, layout: str = 'flat', scratch_dir: str = None):
+        if layout not in OUTPUT_LAYOUTS:
+            raise ValueError(f"layout must be one of {', '.join(OUTPUT_LAYOUTS)}")
+        self.output_dir = os.path.abspath(output_dir)
+        self.layout = layout
+        self.scratch_dir = os.path.abspath(scratch_dir) if scratch_dir else None
+
+    def ydl_options(self) -> Dict[str, Any]:
+        return {
+            'outtmpl': OUTPUT_LAYOUTS[self.layout] + OUTPUT_FILENAME,
+            'paths': {'home': self.scratch_dir or self.output_dir},
+        }
+
+    def shard_for(self, info: Dict[str, Any]) -> str:
+        if self.layout == 'id':
+            return info['id'][:2]
+        if self.layout == 'channel':
+            channel = info.get('channel_id') or info.get('uploader_id') or 'unknown'
+            upload_date = info.get('upload_date') or ''
+            return os.path.join(channel, upload_date[:4] if upload_date[:4].isdigit() else 'unknown')
+        return ''
+
+    def final_path(self, path: str) -> str:
+        if not self.scratch_dir:
+            return path
+        return os.path.join(self.output_dir, os.path.relpath(path, self.scratch_dir))
+
+    def finalize(self, path: str) -> str:
+        final_path = self.final_path(path)
+        if final_path != path:
+            move_atomic(path, final_path)
+        return final_path
+
+def move_atomic(source: str, target: str):
+    os.makedirs(os.path.dirname(target), exist_ok=True)
+    try:
+        os.replace(source, target)
+        return
+    except OSError as e:
+        if e.errno != errno.EXDEV:
+            raise
+    tmp_path = f"{target}.moving"
+    shutil.copyfile(source, tmp_path)
+    shutil.copystat(source, tmp_path)
+    os.replace(tmp_path, target)
+    os.remove(source)
+
+def get_output_layout(settings: Dict[str, Any]) -> OutputLayout:
+    return OutputLayout(settings['output_dir'], settings.get('layout') or 'flat', settings.get('scratch_dir'))
+
+def make_finalizer(layout: OutputLayout):
+    from yt_dlp.postprocessor.common import PostProcessor
+
+    class FinalizePP(PostProcessor):
+        def run(self, info):
+            if info.get('filepath'):
+                info['filepath'] = layout.finalize(info['filepath'])
+            return [], info
+
+    return FinalizePP()
+
+def migrate_layout(output_dir: str, layout: str):
+    target = OutputLayout(output_dir, layout)
+    cache = get_metadata_cache()
+    ledger_info = {}
+    moved = 0
+    skipped = 0
+    for entry in os.scandir(target.output_dir):
+        if not entry.is_file() or entry.name.endswith(PARTIAL_SUFFIXES) or '.part-Frag' in entry.name:
+            continue
+        match = VIDEO_ID_PATTERN.search(entry.name)
+        if not match:
+            skipped += 1
+            continue
+        video_id = match.group(1)
+        info = {'id': video_id}
+        if layout == 'channel':
+            if not ledger_info:
+                ledger_info = {video['id']: video for video in iter_ledger() if video.get('id')}
+            info.update(ledger_info.get(video_id, {}))
+            cached = cache.get('video', video_id) if cache else None
+            info.update(cached or {})
+            if not info.get('channel_id') or not str(info.get('upload_date', ''))[:4].isdigit():
+                # Flat channel listings carry neither, so look the video up the way a new download would
+                try:
+                    info.update(probe_video(info.get('url') or f"https://www.youtube.com/watch?v={video_id}",
+                                            video_id) or {})
+                except Exception as e:
+                    log(f"Could not look up {video_id}: {e}")
+        shard = target.shard_for(info)
+        if not shard:
+            continue
+        destination = os.path.join(target.output_dir, shard, entry.name)
+        if os.path.exists(destination):
+            skipped += 1
+            continue
+        move_atomic(entry.path, destination)
+        moved += 1
+    
+    library = get_library()
+    if library:
+        library.add_root(target.output_dir)
+        library.reconcile([target.output_dir])
+    print(f"Moved {moved} files into the '{layout}' layout, skipped {skipped}")
+    return moved
+
+
+SHORTS_MAX_DURATION = 60
+CHANNEL_ROOT_PATTERN = re.compile(
+    r'^(https?://(?:www\.|m\.)?youtube\.com/(?:@[^/?#]+|c/[^/?#]+|channel/[^/?#]+|user/[^/?#]+))/?(?:[?#].*)?$')
+
+def is_short_duration(duration):
+    return bool(duration) and 0 < duration <= SHORTS_MAX_DURATION
+
+def is_shorts_url(url):
+    if not url:
+        return False
+    path = url.split('?', 1)[0].split('#', 1)[0].rstrip('/')
+    return '/shorts/' in path or path.endswith('/shorts')
+
+def get_shorts_tab_url(channel_url: str):
+    match = CHANNEL_ROOT_PATTERN.match(channel_url.strip())
+    if match:
+        return f"{match.group(1)}/shorts"
+    if is_shorts_url(channel_url):
+        return channel_url
+    return None
+
+def prefilter_entry(entry: Dict[str, Any], shorts_only: bool, from_shorts_tab: bool = False):
+    if not shorts_only:
+        return True
+    duration = entry.get('duration')
+    if duration:
+        return is_short_duration(duration)
+    if from_shorts_tab or is_shorts_url(entry.get('url')):
+        return True
+    return None
+
+CACHE_FILE = 'ytd_cache.sqlite'
+CACHE_TTLS = {
+    'video': 7 * 24 * 3600,
+    'channel': 6 * 3600,
+}
+CACHE_CONFIG = {
+    'enabled': True,
+    'path': CACHE_FILE,
+    'max_bytes': 256 * 1024 * 1024,
+}
+VIDEO_INFO_FIELDS = ('id', 'title', 'duration', 'upload_date', 'view_count', 'webpage_url', 'url',
+                     'channel', 'channel_id', 'uploader', 'uploader_id', 'timestamp', 'thumbnail')
+
+def compact_video_info(info: Dict[str, Any]) -> Dict[str, Any]:
+    return {key: info[key] for key in VIDEO_INFO_FIELDS if info.get(key) is not None}
+
+class MetadataCache:
+    def __init__(self, path=CACHE_FILE, ttls: Dict[str, float] = None, max_bytes: int = 256 * 1024 * 1024):
+        self.path = str(path)
+        self.ttls = {**CACHE_TTLS, **(ttls or {})}
+        self.max_bytes = max_bytes
+        self.lock = threading.Lock()
+        self.hits = {}
+        self.misses = {}
+        self.db = sqlite3.connect(self.path, check_same_thread=False)
+        self.db.execute('PRAGMA journal_mode=WAL')
+        self.db.execute("""
+            CREATE TABLE IF NOT EXISTS cache (
+                kind TEXT NOT NULL,
+                key TEXT NOT NULL,
+                data BLOB NOT NULL,
+                size INTEGER NOT NULL,
+                created REAL NOT NULL,
+                accessed REAL NOT NULL,
+                PRIMARY KEY (kind, key)
+            )""")
+        self.db.execute('CREATE INDEX IF NOT EXISTS cache_accessed ON cache (accessed)')
+        self.db.commit()
+        self.total_bytes = self.db.execute('SELECT COALESCE(SUM(size), 0) FROM cache').fetchone()[0]
+
+    def get(self, kind: str, key: str):
+        now = time.time()
+        with self.lock:
+            row = self.db.execute('SELECT data, created FROM cache WHERE kind = ? AND key = ?', (kind, key)).fetchone()
+            if row is None or now - row[1] > self.ttls.get(kind, 0):
+                self.misses[kind] = self.misses.get(kind, 0) + 1
+                if row is not None:
+                    self._delete(kind, key)
+                return None
+            self.hits[kind] = self.hits.get(kind, 0) + 1
+            self.db.execute('UPDATE cache SET accessed = ? WHERE kind = ? AND key = ?', (now, kind, key))
+            self.db.commit()
+        return json.loads(zlib.decompress(row[0]).decode('utf-8'))
+
+    def put(self, kind: str, key: str, value):
+        if not key:
+            return
+        data = zlib.compress(json.dumps(value).encode('utf-8'))
+        now = time.time()
+        with self.lock:
+            self._delete(kind, key)
+            self.db.execute('INSERT INTO cache (kind, key, data, size, created, accessed) VALUES (?, ?, ?, ?, ?, ?)',
+                            (kind, key, data, len(data), now, now))
+            self.total_bytes += len(data)
+            if self.total_bytes > self.max_bytes:
+                self._evict()
+            self.db.commit()
+
+    def _delete(self, kind, key):
+        row = self.db.execute('SELECT size FROM cache WHERE kind = ? AND key = ?', (kind, key)).fetchone()
+        if row is not None:
+            self.db.execute('DELETE FROM cache WHERE kind = ? AND key = ?', (kind, key))
+            self.total_bytes -= row[0]
+
+    def _evict(self):
+        target = self.max_bytes * 0.9
+        while self.total_bytes > target:
+            rows = self.db.execute('SELECT kind, key, size FROM cache ORDER BY accessed LIMIT 100').fetchall()
+            if not rows:
+                self.total_bytes = 0
+                break
+            for kind, key, size in rows:
+                self.db.execute('DELETE FROM cache WHERE kind = ? AND key = ?', (kind, key))
+                self.total_bytes -= size
+                if self.total_bytes <= target:
+                    break
+
+    def stats(self):
+        with self.lock:
+            return {
+                'hits': sum(self.hits.values()),
+                'misses': sum(self.misses.values()),
+                'bytes': self.total_bytes,
+                'by_kind': {kind: {'hits': self.hits.get(kind, 0), 'misses': self.misses.get(kind, 0)}
+                            for kind in sorted(set(self.hits) | set(self.misses))},
+            }
+
+    def close(self):
+        with self.lock:
+            self.db.close()
+
+_metadata_cache = None
+_metadata_cache_lock = threading.Lock()
+
+def get_metadata_cache():
+    global _metadata_cache
+    if not CACHE_CONFIG['enabled']:
+        return None
+    with _metadata_cache_lock:
+        if _metadata_cache is None:
+            try:
+                _metadata_cache = MetadataCache(CACHE_CONFIG['path'], max_bytes=CACHE_CONFIG['max_bytes'])
+            except sqlite3.Error as e:
+                print(f"Metadata cache unavailable: {e}")
+                CACHE_CONFIG['enabled'] = False
+                return None
+            atexit.register(_metadata_cache.close)
+        return _metadata_cache
+
+def format_cache_stats(cache):
+    if cache is None:
+        return "disabled"
+    stats = cache.stats()
+    return f"{stats['hits']} hits, {stats['misses']} misses"
+
+LIBRARY_FILE = 'ytd_library.sqlite'
+LIBRARY_CONFIG = {
+    'enabled': True,
+    'path': LIBRARY_FILE,
+}
+MEDIA_EXTENSIONS = ('.mp4', '.webm', '.mkv', '.m4a')
+LIBRARY_SORTS = ('mtime', 'size', 'title', 'duration')
+LIBRARY_TITLE_PATTERN = re.compile(r'^(.*?)\s*\[[0-9A-Za-z_-]+\]$')
+
+class MediaLibrary:
+    def __init__(self, path=LIBRARY_FILE):
+        self.path = str(path)
+        self.lock = threading.Lock()
+        self.reconciling = threading.Event()
+        self.db = sqlite3.connect(self.path, check_same_thread=False)
+        self.db.execute('PRAGMA journal_mode=WAL')
+        self.db.execute("""
+            CREATE TABLE IF NOT EXISTS files (
+                path TEXT PRIMARY KEY,
+                dir TEXT NOT NULL,
+                name TEXT NOT NULL,
+                video_id TEXT,
+                title TEXT,
+                size INTEGER NOT NULL,
+                duration REAL,
+                mtime REAL NOT NULL
+            )""")
+        self.db.execute('CREATE TABLE IF NOT EXISTS dirs (path TEXT PRIMARY KEY, parent TEXT, mtime REAL)')
+        self.db.execute('CREATE TABLE IF NOT EXISTS roots (path TEXT PRIMARY KEY)')
+        for column in ('dir', 'video_id', 'title', 'size', 'duration', 'mtime'):
+            self.db.execute(f'CREATE INDEX IF NOT EXISTS files_{column} ON files ({column})')
+        self.db.execute('CREATE INDEX IF NOT EXISTS dirs_parent ON dirs (parent)')
+        self.db.execute("""
+            CREATE TABLE IF NOT EXISTS hashes (
+                path TEXT PRIMARY KEY,
+                size INTEGER NOT NULL,
+                mtime REAL NOT NULL,
+                partial TEXT,
+                full TEXT
+            )""")
+        self.db.execute('CREATE INDEX IF NOT EXISTS hashes_full ON hashes (full)')
+        self.db.commit()
+
+    def add_root(self, directory: str):
+        with self.lock:
+            self.db.execute('INSERT OR IGNORE INTO roots (path) VALUES (?)', (os.path.abspath(directory),))
+            self.db.commit()
+
+    def roots(self) -> List[str]:
+        with self.lock:
+            return [row[0] for row in self.db.execute('SELECT path FROM roots ORDER BY path')]
+
+    def _file_row(self, path: str, stat, duration=None, video_id=None, title=None):
+        name = os.path.basename(path)
+        stem = os.path.splitext(name)[0]
+        if video_id is None:
+            match = VIDEO_ID_PATTERN.search(name)
+            video_id = match.group(1) if match else None
+        if title is None:
+            match = LIBRARY_TITLE_PATTERN.match(stem)
+            title = match.group(1) if match else stem
+        return (path, os.path.dirname(path), name, video_id, title, stat.st_size, duration, stat.st_mtime)
+
+    def record(self, path: str, info: Dict[str, Any] = None):
+        path = os.path.abspath(path)
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return
+        info = info or {}
+        row = self._file_row(path, stat, info.get('duration'), info.get('id'), info.get('title'))
+        with self.lock:
+            self.db.execute('INSERT OR REPLACE INTO files VALUES (?, ?, ?, ?, ?, ?, ?, ?)', row)
+            self.db.commit()
+
+    def reconcile(self, roots: List[str] = None):
+        self.reconciling.set()
+        try:
+            for root in roots or self.roots():
+                self._reconcile_dir(os.path.abspath(root), None)
+        finally:
+            self.reconciling.clear()
+
+    def start_reconcile(self, roots: List[str] = None):
+        if self.reconciling.is_set():
+            return
+        threading.Thread(target=self._reconcile_quietly, args=(roots,), daemon=True).start()
+
+    def _reconcile_quietly(self, roots):
+        try:
+            self.reconcile(roots)
+        except (OSError, sqlite3.Error) as e:
+            log(f"Library reconcile failed: {e}")
+
+    def _reconcile_dir(self, directory: str, parent):
+        with self.lock:
+            row = self.db.execute('SELECT mtime FROM dirs WHERE path = ?', (directory,)).fetchone()
+            children = [child for (child,) in self.db.execute('SELECT path FROM dirs WHERE parent = ?', (directory,))]
+        try:
+            dir_mtime = os.stat(directory).st_mtime
+        except FileNotFoundError:
+            self._forget_dir(directory)
+            return
+        
+        if row is not None and row[0] == dir_mtime:
+            for child in children:
+                self._reconcile_dir(child, directory)
+            return
+        
+        with self.lock:
+            known = {name: (size, mtime) for name, size, mtime in
+                     self.db.execute('SELECT name, size, mtime FROM files WHERE dir = ?', (directory,))}
+        
+        changed = []
+        subdirs = []
+        with os.scandir(directory) as entries:
+            for entry in entries:
+                if entry.is_dir(follow_symlinks=False):
+                    subdirs.append(entry.path)
+                    continue
+                if not entry.name.lower().endswith(MEDIA_EXTENSIONS) or not entry.is_file():
+                    continue
+                stat = entry.stat()
+                previous = known.pop(entry.name, None)
+                if previous != (stat.st_size, stat.st_mtime):
+                    changed.append(self._file_row(entry.path, stat))
+        
+        with self.lock:
+            for row in changed:
+                self.db.execute("""
+                    INSERT INTO files VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+                    ON CONFLICT (path) DO UPDATE SET size = excluded.size, mtime = excluded.mtime""", row)
+            removed = [(os.path.join(directory, name),) for name in known]
+            self.db.executemany('DELETE FROM files WHERE path = ?', removed)
+            self.db.executemany('DELETE FROM hashes WHERE path = ?', removed)
+            self.db.execute('INSERT OR REPLACE INTO dirs (path, parent, mtime) VALUES (?, ?, ?)',
+                            (directory, parent, dir_mtime))
+            self.db.commit()
+        
+        for child in set(children) - set(subdirs):
+            self._forget_dir(child)
+        for subdir in subdirs:
+            self._reconcile_dir(subdir, directory)
+
+    def _forget_dir(self, directory: str):
+        with self.lock:
+            pattern = directory.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_') + os.sep + '%'
+            self.db.execute("DELETE FROM files WHERE dir = ? OR dir LIKE ? ESCAPE '\\'", (directory, pattern))
+            self.db.execute("DELETE FROM dirs WHERE path = ? OR path LIKE ? ESCAPE '\\'", (directory, pattern))
+            self.db.commit()
+
+    def same_size(self, size: int, exclude: str = None) -> List[str]:
+        with self.lock:
+            return [path for (path,) in self.db.execute('SELECT path FROM files WHERE size = ? AND path != ?',
+                                                        (size, exclude or ''))]
+
+    def size_groups(self, roots: List[str], min_size: int = 1):
+        prefixes = [os.path.abspath(root) for root in roots]
+        with self.lock:
+            rows = self.db.execute("""
+                SELECT size, path FROM files WHERE size >= ? AND size IN (
+                    SELECT size FROM files GROUP BY size HAVING COUNT(*) > 1)
+                ORDER BY size, mtime, path""", (min_size,)).fetchall()
+        groups = {}
+        for size, path in rows:
+            if any(path == prefix or path.startswith(prefix + os.sep) for prefix in prefixes):
+                groups.setdefault(size, []).append(path)
+        return [paths for paths in groups.values() if len(paths) > 1]
+
+    def get_hashes(self, path: str, stat):
+        with self.lock:
+            row = self.db.execute('SELECT size, mtime, partial, full FROM hashes WHERE path = ?', (path,)).fetchone()
+        if row is None or (row[0], row[1]) != (stat.st_size, stat.st_mtime):
+            return None, None
+        return row[2], row[3]
+
+    def store_hashes(self, path: str, stat, partial: str = None, full: str = None):
+        with self.lock:
+            self.db.execute("""
+                INSERT INTO hashes (path, size, mtime, partial, full) VALUES (?, ?, ?, ?, ?)
+                ON CONFLICT (path) DO UPDATE SET
+                    partial = COALESCE(excluded.partial, CASE WHEN size = excluded.size AND mtime = excluded.mtime THEN partial END),
+                    full = COALESCE(excluded.full, CASE WHEN size = excluded.size AND mtime = excluded.mtime THEN full END),
+                    size = excluded.size, mtime = excluded.mtime""",
+                (path, stat.st_size, stat.st_mtime, partial, full))
+            self.db.commit()
+
+    def query(self, search: str = None, sort: str = 'mtime', descending: bool = True, limit: int = 10,
+              offset: int = 0):
+        if sort not in LIBRARY_SORTS:
+            raise ValueError(f"sort must be one of {', '.join(LIBRARY_SORTS)}")
+        where, params = '', []
+        if search:
+            where = 'WHERE title LIKE ? OR video_id = ?'
+            params = [f"%{search}%", search]
+        order = f"{sort} {'DESC' if descending else 'ASC'}, path"
+        with self.lock:
+            total = self.db.execute(f'SELECT COUNT(*) FROM files {where}', params).fetchone()[0]
+            rows = self.db.execute(f"""
+                SELECT path, video_id, title, size, duration, mtime FROM files {where}
+                ORDER BY {order} LIMIT ? OFFSET ?""", [*params, limit, offset]).fetchall()
+        keys = ('path', 'id', 'title', 'size', 'duration', 'mtime')
+        return [dict(zip(keys, row)) for row in rows], total
+
+    def close(self):
+        with self.lock:
+            self.db.close()
+
+_library = None
+_library_lock = threading.Lock()
+
+def get_library():
+    global _library
+    if not LIBRARY_CONFIG['enabled']:
+        return None
+    with _library_lock:
+        if _library is None:
+            try:
+                _library = MediaLibrary(LIBRARY_CONFIG['path'])
+            except sqlite3.Error as e:
+                print(f"Library index unavailable: {e}")
+                LIBRARY_CONFIG['enabled'] = False
+                return None
+            atexit.register(_library.close)
+        return _library
+
+def record_download(path: str, info: Dict[str, Any] = None):
+    library = get_library()
+    if library:
+        library.record(path, info)
+        if DEDUP_CONFIG['enabled']:
+            dedup_file(library, path)
+
+def make_library_recorder():
+    from yt_dlp.postprocessor.common import PostProcessor
+
+    class LibraryRecorderPP(PostProcessor):
+        def run(self, info):
+            if info.get('filepath'):
+                record_download(info['filepath'], info)
+            return [], info
+
+    return LibraryRecorderPP()
+
+DEDUP_CONFIG = {
+    'enabled': False,
+    'link': 'auto',
+    'min_size': 1024 * 1024,
+}
+DEDUP_LINK_MODES = ('auto', 'reflink', 'hardlink')
+HASH_CHUNK_SIZE = 1024 * 1024
+PARTIAL_HASH_BYTES = 64 * 1024
+FICLONE = 0x40049409
+_dedup_lock = threading.Lock()
+
+def hash_file(path: str, partial: bool = False) -> str:
+    digest = hashlib.blake2b(digest_size=32)
+    buffer = bytearray(PARTIAL_HASH_BYTES if partial else HASH_CHUNK_SIZE)
+    view = memoryview(buffer)
+    with open(path, 'rb', buffering=0) as f:
+        if partial:
+            size = os.fstat(f.fileno()).st_size
+            digest.update(str(size).encode())
+            digest.update(view[:f.readinto(buffer)])
+            if size > PARTIAL_HASH_BYTES:
+                f.seek(max(PARTIAL_HASH_BYTES, size - PARTIAL_HASH_BYTES))
+                digest.update(view[:f.readinto(buffer)])
+        else:
+            while True:
+                read = f.readinto(buffer)
+                if not read:
+                    break
+                digest.update(view[:read])
+    return digest.hexdigest()
+
+def get_file_hash(library: MediaLibrary, path: str, partial: bool = False):
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    cached = library.get_hashes(path, stat)[0 if partial else 1]
+    if cached:
+        return cached
+    with metrics.timer('hash_partial' if partial else 'hash_full'):
+        value = hash_file(path, partial)
+    library.store_hashes(path, stat, **({'partial': value} if partial else {'full': value}))
+    return value
+
+def reflink_file(source: str, target: str):
+    import fcntl
+
+    with open(source, 'rb') as src, open(target, 'wb') as dst:
+        fcntl.ioctl(dst.fileno(), FICLONE, src.fileno())
+    shutil.copystat(source, target)
+
+def link_duplicate(original: str, duplicate: str, mode: str = 'auto'):
+    tmp_path = f"{duplicate}.dedup.tmp"
+    methods = {'reflink': reflink_file, 'hardlink': os.link}
+    for name in (('reflink', 'hardlink') if mode == 'auto' else (mode,)):
+        try:
+            methods[name](original, tmp_path)
+        except (OSError, ImportError):
+            with contextlib.suppress(OSError):
+                os.remove(tmp_path)
+            continue
+        os.replace(tmp_path, duplicate)
+        return name
+    return None
+
+def is_same_file(first: str, second: str) -> bool:
+    try:
+        return os.path.samefile(first, second)
+    except OSError:
+        return False
+
+def collapse_duplicate(library: MediaLibrary, original: str, duplicate: str, mode: str):
+    with _dedup_lock:
+        if is_same_file(original, duplicate):
+            return 0
+        size = os.path.getsize(duplicate)
+        method = link_duplicate(original, duplicate, mode)
+        if method is None:
+            log(f"Could not link duplicate {duplicate} to {original}")
+            return 0
+        library.record(duplicate)
+        full = library.get_hashes(original, os.stat(original))[1]
+        library.store_hashes(duplicate, os.stat(duplicate), full=full)
+    metrics.inc('dedup_files')
+    metrics.inc('dedup_bytes_saved', size)
+    log(f"Deduplicated ({method}): {os.path.basename(duplicate)} -> {os.path.basename(original)}")
+    return size
+
+def find_duplicate_of(library: MediaLibrary, path: str, candidates: List[str]):
+    candidates = [candidate for candidate in candidates if not is_same_file(candidate, path)]
+    if not candidates:
+        return None
+    partial = get_file_hash(library, path, partial=True)
+    if partial is None:
+        return None
+    candidates = [candidate for candidate in candidates if get_file_hash(library, candidate, partial=True) == partial]
+    if not candidates:
+        return None
+    full = get_file_hash(library, path)
+    for candidate in candidates:
+        if get_file_hash(library, candidate) == full:
+            return candidate
+    return None
+
+def dedup_file(library: MediaLibrary, path: str):
+    path = os.path.abspath(path)
+    try:
+        size = os.path.getsize(path)
+    except OSError:
+        return 0
+    if size < DEDUP_CONFIG['min_size']:
+        return 0
+    original = find_duplicate_of(library, path, library.same_size(size, exclude=path))
+    if original is None:
+        return 0
+    return collapse_duplicate(library, original, path, DEDUP_CONFIG['link'])
+
+def run_dedup_pass(roots: List[str], workers: int = 4, mode: str = 'auto', min_size: int = 1):
+    library = get_library()
+    if library is None:
+        return None
+    for root in roots:
+        library.add_root(root)
+    print(f"Indexing {', '.join(roots)}...")
+    library.reconcile(roots)
+    
+    groups = library.size_groups(roots, min_size)
+    candidates = sum(len(paths) for paths in groups)
+    print(f"{candidates} files share a size with another file ({len(groups)} sizes)")
+    
+    def hash_all(paths, partial):
+        hashes = dict(zip(paths, executor.map(lambda path: get_file_hash(library, path, partial), paths)))
+        grouped = {}
+        for path in paths:
+            if hashes[path]:
+                grouped.setdefault(hashes[path], []).append(path)
+        return [same for same in grouped.values() if len(same) > 1]
+    
+    duplicates = 0
+    saved = 0
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as executor:
+        for paths in groups:
+            for same_partial in hash_all(paths, partial=True):
+                for same_full in hash_all(same_partial, partial=False):
+                    original = same_full[0]
+                    for duplicate in same_full[1:]:
+                        reclaimed = collapse_duplicate(library, original, duplicate, mode)
+                        if reclaimed:
+                            duplicates += 1
+                            saved += reclaimed
+    
+    print(f"Replaced {duplicates} duplicates, reclaimed {saved / (1024 * 1024):.1f} MB")
+    return {'candidates': candidates, 'duplicates': duplicates, 'bytes_saved': saved}
+
+def get_detail_options():
+    return {
+        **get_yt_dlp_options(),
+        'quiet': True,
+        'no_warnings': True,
+        'socket_timeout': 10,
+        'retries': 1,
+        'ignoreerrors': False,
+    }
+
+def extract_video_info(url: str):
+    metrics.inc('probes')
+    with metrics.timer('probe', url=url), open_ydl(get_detail_options()) as detail_ydl:
+        return detail_ydl.extract_info(url, download=False)
+
+def probe_video(url: str, video_id: str = None, stopped=None):
+    cache = get_metadata_cache()
+    if cache and video_id:
+        cached = cache.get('video', video_id)
+        if cached is not None:
+            return cached
+    
+    video_info = call_with_backoff(extract_video_info, url, stopped=stopped)
+    
+    if cache and video_info:
+        cache.put('video', video_info.get('id') or video_id, compact_video_info(video_info))
+    return video_info
+
+SYNC_STATE_FILE = 'channel_sync.json'
+SYNC_RECENT_IDS = 20
+
+class ChannelSyncState:
+    def __init__(self, path=SYNC_STATE_FILE):
+        self.path = Path(path)
+        self.marks = {}
+        if self.path.exists():
+            try:
+                with open(self.path, 'r') as f:
+                    self.marks = json.load(f)
+            except ValueError as e:
+                print(f"Ignoring unreadable sync state {self.path}: {e}")
+
+    def get(self, key: str):
+        return self.marks.get(key)
+
+    def update(self, key: str, newest: List[Dict[str, Any]]):
+        previous = self.marks.get(key) or {}
+        recent_ids = [entry['id'] for entry in newest if entry.get('id')]
+        recent_ids += [video_id for video_id in previous.get('recent_ids', []) if video_id not in recent_ids]
+        if not recent_ids:
+            return
+        upload_dates = [entry.get('upload_date') for entry in newest if entry.get('upload_date')]
+        upload_dates.append(previous.get('upload_date'))
+        self.marks[key] = {
+            'video_id': recent_ids[0],
+            'upload_date': max(date for date in upload_dates if date) if any(upload_dates) else None,
+            'recent_ids': recent_ids[:SYNC_RECENT_IDS],
+            'synced_at': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        }
+
+    def save(self):
+        tmp_path = self.path.with_name(self.path.name + '.tmp')
+        with open(tmp_path, 'w') as f:
+            json.dump(self.marks, f, indent=2)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.path)
+
+def reached_sync_mark(entry: Dict[str, Any], mark: Dict[str, Any]):
+    if entry.get('id') and entry['id'] in mark.get('recent_ids', ()):
+        return True
+    upload_date = entry.get('upload_date')
+    return bool(upload_date and mark.get('upload_date') and upload_date < mark['upload_date'])
+
+def trim_sync_mark(newest: List[Dict[str, Any]], failed_ids: set):
+    # The next sync stops at the first entry it recognises, so keep only entries older than any failure
+    ids = [entry.get('id') for entry in newest]
+    positions = [ids.index(video_id) for video_id in failed_ids if video_id in ids]
+    return newest[max(positions) + 1:] if positions else newest
+
+SCAN_PAGE_SIZE = 30
+
+def paced_entries(entries, page_size: int = SCAN_PAGE_SIZE):
+    # Continuation pages are fetched inside next(), outside call_with_backoff, so take a token per page here
+    if isinstance(entries, (list, tuple)):
+        yield from entries
+        return
+    controller = get_rate_controller()
+    iterator = iter(entries)
+    count = 0
+    while True:
+        new_page = count and count % page_size == 0
+        if new_page:
+            controller.acquire()
+        try:
+            entry = next(iterator)
+        except StopIteration:
+            return
+        except Exception as e:
+            if is_throttle_error(e):
+                controller.throttled(e)
+            raise
+        if new_page:
+            controller.success()
+        count += 1
+        yield entry
+
+def iter_channel_entries(info: Dict[str, Any], key: str, sync_state: ChannelSyncState = None, sync_marks: Dict[str, Any] = None):
+    mark = sync_state.get(key) if sync_state else None
+    newest = []
+    for entry in paced_entries(info.get('entries') or []):
+        if entry is None:
+            continue
+        if entry.get('_type') == 'playlist':
+            nested_key = f"{key}#{entry.get('webpage_url') or entry.get('id')}:{entry.get('title')}"
+            yield from iter_channel_entries(entry, nested_key, sync_state, sync_marks)
+            continue
+        if mark and reached_sync_mark(entry, mark):
+            break
+        if sync_marks is not None and len(newest) < SYNC_RECENT_IDS and entry.get('id'):
+            newest.append(entry)
+        yield entry
+    if sync_marks is not None and newest:
+        sync_marks[key] = newest
+
+SCAN_QUEUE_SIZE = 200
+_SCAN_DONE = object()
+
+class EntryStream:
+    def __init__(self, entries, maxsize: int = SCAN_QUEUE_SIZE):
+        self.queue = queue.Queue(maxsize=maxsize)
+        self.stop_event = threading.Event()
+        self.error = None
+        self.finished = False
+        metrics.track('scan_queue_depth', self.qsize)
+        self.thread = threading.Thread(target=self._produce, args=(entries,), daemon=True)
+        self.thread.start()
+
+    def _put(self, item):
+        while not self.stop_event.is_set():
+            try:
+                self.queue.put(item, timeout=0.5)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def _produce(self, entries):
+        try:
+            with metrics.timer('scan_enumerate'):
+                for entry in entries:
+                    metrics.inc('entries_scanned')
+                    if not self._put(entry):
+                        return
+        except Exception as e:
+            self.error = e
+        finally:
+            self._put(_SCAN_DONE)
+
+    def __iter__(self):
+        try:
+            while True:
+                item = self.queue.get()
+                if item is _SCAN_DONE:
+                    break
+                yield item
+            if self.error is not None:
+                raise self.error
+            self.finished = True
+        finally:
+            self.stop_event.set()
+
+    def qsize(self):
+        return self.queue.qsize()
+
+    def close(self):
+        self.stop_event.set()
+        metrics.untrack('scan_queue_depth', self.qsize)
+
+def open_channel_scan(scan_ydl, channel_url: str, shorts_only: bool, stopped=None):
+    with metrics.timer('scan'):
+        return _open_channel_scan(scan_ydl, channel_url, shorts_only, stopped)
+
+def _open_channel_scan(scan_ydl, channel_url, shorts_only, stopped):
+    channel_info = None
+    scan_url = get_shorts_tab_url(channel_url) if shorts_only else None
+    if scan_url:
+        print(f"Scanning shorts tab: {scan_url}")
+        try:
+            channel_info = call_with_backoff(scan_ydl.extract_info, scan_url, download=False, process=False, stopped=stopped)
+        except Exception as e:
+            if is_rate_limited(e):
+                raise
+            channel_info = None
+    if not channel_info or 'entries' not in channel_info:
+        scan_url = channel_url
+        channel_info = call_with_backoff(scan_ydl.extract_info, channel_url, download=False, process=False, stopped=stopped)
+    return channel_info, scan_url
+
+QUALITY_PRESETS = {
+    'best': {},
+    'good': {'max_height': 1080},
+    'standard': {'max_height': 480},
+}
+CODEC_PREFERENCE = ('av01', 'vp9', 'avc1')
+AUDIO_EXTS = {'mp4': ('m4a', 'mp4'), 'webm': ('webm',)}
+
+def codec_family(vcodec) -> str:
+    vcodec = (vcodec or '').lower()
+    if vcodec.startswith('av01'):
+        return 'av01'
+    if vcodec.startswith(('vp9', 'vp09')):
+        return 'vp9'
+    if vcodec.startswith(('avc', 'h264')):
+        return 'avc1'
+    return vcodec.split('.')[0]
+
+def estimate_size(fmt: Dict[str, Any]):
+    return fmt.get('filesize') or fmt.get('filesize_approx')
+
+def short_side(fmt: Dict[str, Any]) -> int:
+    # Like yt-dlp's res: a 1080x1920 short is 1080p
+    sides = [side for side in (fmt.get('width'), fmt.get('height')) if side]
+    return min(sides) if sides else 0
+
+def has_video(fmt: Dict[str, Any]) -> bool:
+    return fmt.get('vcodec') != 'none'
+
+def has_audio(fmt: Dict[str, Any]) -> bool:
+    return fmt.get('acodec') != 'none'
+
+class FormatSelector:
+    def __init__(self, max_height: int = None, budget: int = None, codecs=CODEC_PREFERENCE, allow_merge: bool = True):
+        self.max_height = max_height
+        self.budget = budget
+        self.codecs = tuple(codecs)
+        self.allow_merge = allow_merge
+        self.lock = threading.Lock()
+        self.bytes_saved = 0
+
+    def _best_audio(self, audio_formats, video_ext):
+        compatible = [fmt for fmt in audio_formats if fmt.get('ext') in AUDIO_EXTS.get(video_ext, ())]
+        return max(compatible or audio_formats, key=lambda fmt: fmt.get('abr') or fmt.get('tbr') or 0)
+
+    def _candidates(self, formats):
+        candidates = [(fmt,) for fmt in formats if has_video(fmt) and has_audio(fmt) and fmt.get('ext') != 'mhtml']
+        audio_formats = [fmt for fmt in formats if has_audio(fmt) and not has_video(fmt)]
+        if self.allow_merge and audio_formats:
+            for fmt in formats:
+                if has_video(fmt) and not has_audio(fmt) and fmt.get('ext') != 'mhtml':
+                    candidates.append((fmt, self._best_audio(audio_formats, fmt.get('ext'))))
+        if not candidates:
+            # Audio-only or video-only extractors: fall back to the single tracks, as plain 'best' does
+            candidates = [(fmt,) for fmt in formats if (has_video(fmt) or has_audio(fmt)) and fmt.get('ext') != 'mhtml']
+        return candidates
+
+    def _size(self, candidate):
+        sizes = [estimate_size(fmt) for fmt in candidate]
+        return None if None in sizes else sum(sizes)
+
+    def _bitrate(self, candidate):
+        return sum(fmt.get('tbr') or fmt.get('vbr') or fmt.get('abr') or 0 for fmt in candidate)
+
+    def _codec_rank(self, candidate):
+        family = codec_family(candidate[0].get('vcodec'))
+        return len(self.codecs) - self.codecs.index(family) if family in self.codecs else 0
+
+    def choose(self, formats):
+        candidates = self._candidates(formats)
+        if not candidates:
+            return None, None
+        height = lambda candidate: short_side(candidate[0])
+        # yt-dlp already estimates filesize_approx from tbr and duration, so anything still
+        # unsized can't be judged and ranks behind formats of known size
+        size = lambda candidate: self._size(candidate) or float('inf')
+        reference = max(candidates, key=lambda candidate: (height(candidate), self._size(candidate) or 0))
+
+        eligible = candidates
+        if self.max_height:
+            eligible = ([candidate for candidate in candidates if height(candidate) <= self.max_height]
+                        or [min(candidates, key=height)])
+        if self.budget:
+            sized = [candidate for candidate in eligible if self._size(candidate) is not None]
+            if sized:
+                eligible = ([candidate for candidate in sized if size(candidate) <= self.budget]
+                            or [min(sized, key=size)])
+        # Within the budget the smaller file wins a tie; otherwise the smoother, higher-bitrate one
+        tie_break = (lambda candidate: -size(candidate)) if self.budget else self._bitrate
+        chosen = max(eligible, key=lambda candidate: (height(candidate), self._codec_rank(candidate),
+                                                      candidate[0].get('fps') or 0, tie_break(candidate)))
+        return chosen, reference
+
+    def __call__(self, ctx):
+        chosen, reference = self.choose(ctx['formats'])
+        if chosen is None:
+            return
+        chosen_size, reference_size = self._size(chosen), self._size(reference)
+        if chosen_size and reference_size and reference_size > chosen_size:
+            with self.lock:
+                self.bytes_saved += reference_size - chosen_size
+            metrics.inc('format_bytes_saved', reference_size - chosen_size)
+
+        if len(chosen) == 1:
+            yield chosen[0]
+            return
+        video, audio = chosen
+        ext = video['ext'] if audio.get('ext') in AUDIO_EXTS.get(video.get('ext'), ()) else 'mkv'
+        yield {
+            'format_id': f"{video['format_id']}+{audio['format_id']}",
+            'ext': ext,
+            'requested_formats': [video, audio],
+            'protocol': f"{video.get('protocol', 'https')}+{audio.get('protocol', 'https')}",
+            'width': video.get('width'),
+            'height': video.get('height'),
+            'vcodec': video.get('vcodec'),
+            'acodec': audio.get('acodec'),
+            'filesize_approx': self._size(chosen),
+        }
+
+def get_format_option(settings: Dict[str, Any]):
+    quality = settings.get('quality', 'best')
+    if quality not in QUALITY_PRESETS:
+        return quality
+    preset = QUALITY_PRESETS[quality]
+    return FormatSelector(
+        max_height=settings.get('max_height') or preset.get('max_height'),
+        budget=settings.get('format_budget'),
+        codecs=settings.get('codecs') or CODEC_PREFERENCE,
+        allow_merge=shutil.which('ffmpeg') is not None,
+    )
 
-            if not channel_info or 'entries' not in channel_info:
-                print("No videos found in channel or invalid channel")
-                return []
-            
-            valid_entries = [entry for entry in channel_info['entries'] if entry is not None]
-            
-            if not valid_entries:
-                print(f"No {video_type} found in this channel")
-                return []
-                
-            print(f"Found {len(valid_entries)} {video_type}")
-            
-            videos = []
-            for entry in valid_entries:
-                videos.append({
-                    'url': entry.get('webpage_url', entry.get('url', '')),
-                    'title': entry.get('title', 'Unknown'),
-                    'duration': entry.get('duration', 0),
-                    'upload_date': entry.get('upload_date', 'Unknown'),
-                    'view_count': entry.get('view_count', 0),
-                    'id': entry.get('id', '')
-                })
-            
-            return videos
-            
-    except KeyboardInterrupt:
-        print(f"\nOperation cancelled by user")
-        return []
-    except Exception as e:
-        print(f"Critical error: {e}")
-        return []
+def format_bytes_saved(pool) -> str:
+    return f"{(pool.bytes_saved or 0) / (1024 * 1024):.1f} MB (estimated)"
+
+def get_download_options(base_opts: Dict[str, Any], settings: Dict[str, Any], layout: OutputLayout) -> Dict[str, Any]:
+    return {
+        **base_opts,
+        **layout.ydl_options(),
+        'format': get_format_option(settings),
+        'quiet': False,
+        'no_warnings': False,
+        'writeinfojson': False,
+        'writethumbnail': False,
+        'continuedl': True,
+        'progress_hooks': list(settings.get('progress_hooks', [])),
+        **get_connection_options(settings),
+    }
+
+def start_queue_runner(job: Dict[str, Any], pool: DownloadPool, on_failure=None):
+    work_queue = get_work_queue()
+    if work_queue is None:
+        return None
+    name = queue_name_for(job)
+    work_queue.create(name, job_to_spec(job))
+    print(f"Work queue: {name} ({format_queue_counts(work_queue.counts(name))})")
+    return QueueRunner(work_queue, name, pool, on_failure).start()
+
+def new_job_summary(**fields):
+    return {
+        'status': 'ok',
+        'downloaded': 0,
+        'failed': 0,
+        **fields,
+    }
+
+def pool_status(pool: DownloadPool, completed: bool = True):
+    if pool.bot_detected:
+        return 'bot_detected'
+    if pool.stopped or not completed:
+        return 'cancelled'
+    return 'ok'
 
 def download_videos_streaming(channel_url: str, settings: Dict[str, Any], shorts_only: bool = True):
+    downloaded = 0
+    probe_failures = 0
+    pool = None
+    runner = None
+    scan_stream = None
+    summary = new_job_summary(channel=channel_url, mode='shorts' if shorts_only else 'all',
+                              output_dir=settings['output_dir'])
+    get_rate_controller().reset()
     try:
         import yt_dlp
         
         Path(settings['output_dir']).mkdir(exist_ok=True)
+        layout = get_output_layout(settings)
+        library = get_library()
+        if library:
+            library.add_root(settings['output_dir'])
         
         base_opts = get_yt_dlp_options()
         cookies = try_get_cookies()
         
-        if cookies:
-            base_opts['cookiesfrombrowser'] = cookies
-        
-        download_opts = {
-            **base_opts,
-            'outtmpl': f"{settings['output_dir']}/%(title)s [%(id)s].%(ext)s",
-            'format': 'best',
-            'quiet': False,
-            'no_warnings': False,
-            'writeinfojson': False,
-            'writethumbnail': False,
-        }
+        download_opts = get_download_options(base_opts, settings, layout)
         
         scan_opts = {
             **base_opts,
             'quiet': True,
             'no_warnings': True,
             'extract_flat': True,
+            'ignoreerrors': False,
         }
         
+        workers = settings.get('workers', 1)
+        resume = settings.get('resume', True)
+        sync = settings.get('sync', False)
         video_type = "shorts" if shorts_only else "videos"
         print(f"\nSTREAMING DOWNLOAD MODE")
         print("-" * 40)
         print(f"Channel: {channel_url}")
         print(f"Output: {settings['output_dir']}")
         print(f"Type: {video_type}")
-        print(f"Quality: Best available format")
+        print(f"Quality: {settings['quality']}")
+        print(f"Workers: {workers}")
+        print(f"Connections per download: {download_opts['concurrent_fragment_downloads']}")
+        print(f"Resume: {'Enabled' if resume else 'Disabled'}")
+        print(f"Incremental sync: {'Enabled' if sync else 'Disabled'}")
         print(f"Bot bypass: {'Enabled with cookies' if cookies else 'Enabled without cookies'}")
         print("-" * 40)
         print(f"Scanning and downloading {video_type} as found...")
         print("Press Ctrl+C to stop at any time")
         print("-" * 40)
 
-        downloaded = 0
-        failed = 0
+        found = 0
         processed = 0
+        skipped = 0
+        probes = 0
+        probes_avoided = 0
+        ledger = get_ledger()
+        known_ids = set()
+        if resume:
+            known_ids, partial_ids = collect_known_ids(settings['output_dir'], ledger, settings.get('scratch_dir'))
+            print(f"Resume: {len(known_ids)} known videos will be skipped, {len(partial_ids)} partial downloads will be resumed")
+        sync_state = ChannelSyncState() if sync else None
+        sync_marks = {}
+        sync_failures = set()
+        pool = DownloadPool(download_opts, workers, settings.get('limiter'), settings.get('cancel_event'),
+                            settings.get('size_budget'), layout)
+        job = {'channel': channel_url, 'mode': 'shorts' if shorts_only else 'all', 'settings': settings}
+        runner = start_queue_runner(job, pool, on_failure=lambda item, error:
+                                    sync_failures.add((item['data'] or {}).get('id')))
+        record_failure = make_failure_recorder(job)
         
-        with yt_dlp.YoutubeDL(scan_opts) as scan_ydl:
+        with open_ydl(scan_opts) as scan_ydl:
             try:
                 print("Preparing to scan channel...")
-                add_delay(3, 5)
-                
-                channel_info = scan_ydl.extract_info(channel_url, download=False)
+                channel_info, scan_url = open_channel_scan(scan_ydl, channel_url, shorts_only, stopped=lambda: pool.stopped)
+                from_shorts_tab = shorts_only and is_shorts_url(scan_url)
                 
                 if not channel_info or 'entries' not in channel_info:
                     print("No videos found in channel")
-                    return
+                    summary['status'] = 'empty'
+                    return summary
                 
-                valid_entries = [entry for entry in channel_info['entries'] if entry is not None]
-                total = len(valid_entries)
-                print(f"Found {total} total videos in channel")
-                print(f"Now checking each video and downloading {video_type} immediately...\n")
+                if sync:
+                    entries = iter_channel_entries(channel_info, f"{video_type}:{scan_url}", sync_state, sync_marks)
+                    print(f"Walking channel newest-first, stopping at the last synced upload")
+                else:
+                    entries = iter_channel_entries(channel_info, scan_url)
+                total = '?'
+                scan_stream = EntryStream(entries)
+                valid_entries = scan_stream
+                print(f"Now checking each video and downloading {video_type} as pages arrive...\n")
                 
                 for i, entry in enumerate(valid_entries, 1):
+                    if pool.stopped:
+                        break
                     try:
                         processed += 1
                         
-                        detail_opts = {
-                            **get_yt_dlp_options(),
-                            'quiet': True,
-                            'no_warnings': True,
-                            'socket_timeout': 10,
-                            'retries': 1,
-                        }
+                        if entry.get('id') in known_ids:
+                            skipped += 1
+                            continue
                         
-                        add_delay(0.5, 1.0)
+                        should_download = prefilter_entry(entry, shorts_only, from_shorts_tab)
+                        if should_download is None:
+                            video_info = probe_video(entry['url'], entry.get('id'), stopped=lambda: pool.stopped)
+                            probes += 1
+                            if not video_info:
+                                continue
+                            should_download = is_short_duration(video_info.get('duration')) if shorts_only else True
+                        else:
+                            video_info = entry
+                            probes_avoided += 1
+                            metrics.inc('probes_avoided')
                         
-                        with yt_dlp.YoutubeDL(detail_opts) as detail_ydl:
-                            video_info = detail_ydl.extract_info(entry['url'], download=False)
-                            duration = video_info.get('duration', 0)
-                            title = video_info.get('title', 'Unknown')
-                            
-                            if i % 10 == 0:
-                                print(f"Progress: {i}/{total} checked | Downloaded: {downloaded} | Failed: {failed}")
-                            
-                            should_download = False
-                            if shorts_only:
-                                should_download = duration and 0 < duration <= 60
-                            else:
-                                should_download = True
-                            
-                            if should_download:
-                                print(f"\nFOUND {video_type.upper()} #{downloaded + 1}")
+                        duration = video_info.get('duration') or 0
+                        title = video_info.get('title') or 'Unknown'
+                        
+                        if i % 10 == 0:
+                            log(f"Progress: {i} checked | Scan queue: {scan_stream.qsize()} | Downloaded: {pool.downloaded} | Failed: {pool.failed}")
+                        
+                        if should_download:
+                            found += 1
+                            with print_lock:
+                                print(f"\nFOUND {video_type.upper()} #{found}")
                                 print(f"Title: {title}")
                                 if duration:
                                     print(f"Duration: {duration}s")
-                                print("Downloading now...")
-                                
-                                try:
-                                    add_delay(1, 2)
-                                    
-                                    with yt_dlp.YoutubeDL(download_opts) as download_ydl:
-                                        download_ydl.download([entry['url']])
-                                    
-                                    downloaded += 1
-                                    print(f"Downloaded successfully!")
-                                    
-                                    video_data = {
-                                        'url': entry['url'],
-                                        'title': title,
-                                        'duration': duration,
-                                        'upload_date': video_info.get('upload_date', 'Unknown'),
-                                        'view_count': video_info.get('view_count', 0),
-                                        'id': video_info.get('id', ''),
-                                        'downloaded': True
-                                    }
-                                    
-                                    log_file = Path('downloaded_videos.json')
-                                    if log_file.exists():
-                                        with open(log_file, 'r') as f:
-                                            log_data = json.load(f)
-                                    else:
-                                        log_data = []
-                                    
-                                    log_data.append(video_data)
-                                    with open(log_file, 'w') as f:
-                                        json.dump(log_data, f, indent=2)
-                                    
-                                except Exception as e:
-                                    failed += 1
-                                    error_msg = str(e).lower()
-                                    if 'sign in' in error_msg or 'bot' in error_msg:
-                                        print(f"Bot detection triggered during download!")
-                                        print(f"Stopping to avoid further detection")
-                                        break
-                                    else:
-                                        print(f"Download failed: {e}")
-                                
+                                print("Downloading now..." if pool.workers == 1 else "Queued for download")
                                 print("-" * 40)
+                            
+                            video_data = {
+                                'url': entry['url'],
+                                'title': title,
+                                'duration': duration,
+                                'upload_date': video_info.get('upload_date') or 'Unknown',
+                                'view_count': video_info.get('view_count') or 0,
+                                'id': video_info.get('id') or entry.get('id', ''),
+                                'channel_id': video_info.get('channel_id') or channel_info.get('channel_id'),
+                                'downloaded': True
+                            }
+                            if runner:
+                                runner.put(entry['url'], f"[#{found}]", video_data)
+                            else:
+                                pool.submit(entry['url'], f"[#{found}]",
+                                            on_success=lambda video_data=video_data: ledger.append(video_data),
+                                            on_failure=lambda error, label=f"[#{found}]", video_data=video_data: (
+                                                sync_failures.add(video_data['id']),
+                                                record_failure(video_data['url'], label, video_data, error)))
                         
                     except KeyboardInterrupt:
-                        print(f"\nStopped by user at video {i}/{total}")
+                        pool.stop()
+                        log(f"\nStopped by user at video {i}")
                         break
                     except Exception as e:
-                        error_msg = str(e).lower()
-                        if 'sign in' in error_msg or 'bot' in error_msg:
-                            print(f"\nBot detection triggered at video {i}")
-                            print(f"Stopping to avoid further detection")
+                        if is_rate_limited(e):
+                            pool.stop()
+                            log(f"\nBot detection triggered at video {i}")
+                            log(f"Stopping to avoid further detection")
                             break
+                        # Not queued for retry: queued items skip the shorts check. Holding the sync mark
+                        # (or, without sync, the next full scan) checks the video again
+                        probe_failures += 1
+                        metrics.inc('probes_failed')
+                        sync_failures.add(entry.get('id'))
+                        log(f"Could not check {entry.get('url') or entry.get('id')}: {e}")
                         continue
                 
+                scan_stream.close()
+                completed = not pool.stopped and scan_stream.finished
+                if completed:
+                    log("Waiting for remaining downloads to finish...")
+                if runner:
+                    runner.finish()
+                pool.close()
+                ledger.sync()
+                downloaded = pool.downloaded
+                
+                if sync and completed and not pool.stopped:
+                    # A failure outside every tracked window can't be placed, so hold all marks
+                    tracked = {entry.get('id') for newest in sync_marks.values() for entry in newest}
+                    unplaced = bool(sync_failures - tracked)
+                    held = 0
+                    for key, newest in sync_marks.items():
+                        trimmed = [] if unplaced else trim_sync_mark(newest, sync_failures)
+                        if trimmed:
+                            sync_state.update(key, trimmed)
+                        elif newest:
+                            held += 1
+                    sync_state.save()
+                    if sync_marks:
+                        print(f"Sync: high-water mark updated for {len(sync_marks) - held} playlist(s)")
+                    if held:
+                        print(f"Sync: {held} playlist(s) held back by failed downloads")
+                total = processed
+                
                 print(f"\nSTREAMING DOWNLOAD COMPLETE!")
                 print("=" * 50)
                 print(f"Videos processed: {processed}/{total}")
-                print(f"Downloaded: {downloaded}")
-                print(f"Failed: {failed}")
+                print(f"Skipped (already downloaded): {skipped}")
+                print(f"Metadata probes: {probes} made, {probes_avoided} avoided")
+                print(f"Metadata cache: {format_cache_stats(get_metadata_cache())}")
+                print(f"Downloaded: {pool.downloaded}")
+                print(f"Failed: {pool.failed}")
+                if probe_failures:
+                    print(f"Could not check: {probe_failures} (checked again on the next run)")
+                if pool.failed and not runner and RETRY_CONFIG['enabled']:
+                    print(f"Failed downloads are kept in {RETRY_CONFIG['path']}; retry them with: python ytd.py --retry")
+                if pool.bytes_saved is not None:
+                    print(f"Saved vs best: {format_bytes_saved(pool)}")
+                if runner:
+                    print(f"Work queue: {format_queue_counts(runner.queue.counts(runner.name))}")
                 print(f"Location: {os.path.abspath(settings['output_dir'])}")
-                print(f"Download log: downloaded_videos.json")
+                print(f"Download log: {LEDGER_FILE}")
                 print("=" * 50)
                 
+                summary.update(status=pool_status(pool, completed), processed=processed, skipped=skipped,
+                               probes=probes, probes_avoided=probes_avoided)
+                
             except Exception as e:
-                error_msg = str(e).lower()
-                if 'sign in' in error_msg or 'bot' in error_msg:
+                summary['error'] = str(e)
+                if is_rate_limited(e):
+                    summary['status'] = 'bot_detected'
                     print(f"YouTube bot detection triggered!")
                     print(f"SOLUTIONS:")
                     print(f"  1. Wait 10-15 minutes before trying again")
@@ -299,101 +2909,944 @@ def download_videos_streaming(channel_url: str, settings: Dict[str, Any], shorts
                     print(f"  3. Make sure you're logged into YouTube in Chrome")
                     print(f"  4. Try a different channel or smaller channel")
                 else:
+                    summary['status'] = 'error'
                     print(f"Error scanning channel: {e}")
                 
     except KeyboardInterrupt:
+        summary['status'] = 'cancelled'
+        if pool:
+            pool.stop()
+            pool.close()
+            downloaded = pool.downloaded
         print(f"\nOperation cancelled by user")
         print(f"Downloaded {downloaded} videos before stopping")
     except Exception as e:
+        summary.update(status='error', error=str(e))
         print(f"Critical error: {e}")
+    finally:
+        if scan_stream:
+            scan_stream.close()
+        if pool:
+            pool.close()
+            summary.update(downloaded=pool.downloaded, failed=pool.failed + probe_failures, bytes_saved=pool.bytes_saved)
+        if runner:
+            runner.close()
+            summary['queue'] = runner.queue.counts(runner.name)
+    
+    return summary
+
+YOUTUBE_VIDEO_ID_PATTERN = re.compile(r'^[0-9A-Za-z_-]{11}$')
+YOUTUBE_HOSTS = ('youtube.com', 'www.youtube.com', 'm.youtube.com', 'music.youtube.com', 'youtube-nocookie.com',
+                 'www.youtube-nocookie.com')
+YOUTUBE_ID_PATHS = ('shorts', 'embed', 'live', 'v', 'e')
+VIDEO_ID_ALPHABET = 'ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz0123456789-_'
+LINK_CHUNK_SIZE = 500
+
+def canonical_video_id(link: str):
+    link = link.strip()
+    if YOUTUBE_VIDEO_ID_PATTERN.match(link):
+        return link
+    parsed = urlparse(link if '://' in link else f"https://{link}")
+    host = (parsed.hostname or '').lower()
+    parts = [part for part in parsed.path.split('/') if part]
+    video_id = None
+    if host in ('youtu.be', 'www.youtu.be'):
+        video_id = parts[0] if parts else None
+    elif host in YOUTUBE_HOSTS:
+        if parts == ['watch']:
+            video_id = (parse_qs(parsed.query).get('v') or [None])[0]
+        elif len(parts) >= 2 and parts[0] in YOUTUBE_ID_PATHS:
+            video_id = parts[1]
+    if video_id and YOUTUBE_VIDEO_ID_PATTERN.match(video_id):
+        return video_id
+    return None
+
+def canonical_video_url(video_id: str) -> str:
+    return f"https://www.youtube.com/watch?v={video_id}"
+
+def video_id_key(video_id: str) -> int:
+    # Packs the 11 characters into one 66-bit int, which takes far less room in a set than the string
+    key = 0
+    for char in video_id:
+        key = (key << 6) | VIDEO_ID_ALPHABET.index(char)
+    return key
+
+def iter_link_file(path: str, stats: Dict[str, int], known_ids=()):
+    seen_ids = set()
+    seen_links = set()
+    with open(path, 'r') as f:
+        for line in f:
+            link = line.strip()
+            if not link or link.startswith('#'):
+                continue
+            stats['lines'] += 1
+            video_id = canonical_video_id(link)
+            if video_id is None:
+                if link in seen_links:
+                    stats['duplicates'] += 1
+                    continue
+                seen_links.add(link)
+                stats['other'] += 1
+                yield link, None
+                continue
+            key = video_id_key(video_id)
+            if key in seen_ids:
+                stats['duplicates'] += 1
+                continue
+            seen_ids.add(key)
+            if video_id in known_ids:
+                stats['known'] += 1
+                continue
+            yield canonical_video_url(video_id), video_id
 
 def download_from_text_file(file_path: str, settings: Dict[str, Any]):
+    downloaded = 0
+    pool = None
+    runner = None
+    summary = new_job_summary(file=file_path, output_dir=settings['output_dir'])
+    get_rate_controller().reset()
     try:
         import yt_dlp
         
         if not Path(file_path).exists():
             print(f"File not found: {file_path}")
-            return
-        
-        with open(file_path, 'r') as f:
-            links = [line.strip() for line in f if line.strip() and not line.startswith('#')]
-        
-        if not links:
-            print("No valid links found in file")
-            return
+            summary.update(status='error', error='file not found')
+            return summary
         
         Path(settings['output_dir']).mkdir(exist_ok=True)
+        layout = get_output_layout(settings)
+        library = get_library()
+        if library:
+            library.add_root(settings['output_dir'])
         
         base_opts = get_yt_dlp_options()
         cookies = try_get_cookies()
         
-        if cookies:
-            base_opts['cookiesfrombrowser'] = cookies
-        
-        download_opts = {
-            **base_opts,
-            'outtmpl': f"{settings['output_dir']}/%(title)s [%(id)s].%(ext)s",
-            'format': settings['quality'],
-            'quiet': False,
-            'no_warnings': False,
-            'writeinfojson': False,
-            'writethumbnail': False,
-        }
+        download_opts = get_download_options(base_opts, settings, layout)
         
+        workers = settings.get('workers', 1)
         print(f"\nDOWNLOAD FROM TEXT FILE")
         print("-" * 40)
         print(f"File: {file_path}")
-        print(f"Links found: {len(links)}")
         print(f"Output: {settings['output_dir']}")
         print(f"Quality: {settings['quality']}")
+        print(f"Workers: {workers}")
+        print(f"Connections per download: {download_opts['concurrent_fragment_downloads']}")
         print(f"Bot bypass: {'Enabled with cookies' if cookies else 'Enabled without cookies'}")
         print("-" * 40)
         print("Starting downloads...")
         print("Press Ctrl+C to stop at any time")
         print("-" * 40)
         
-        downloaded = 0
-        failed = 0
+        ledger = get_ledger()
+        known_ids = set()
+        if settings.get('resume', True):
+            known_ids, partial_ids = collect_known_ids(settings['output_dir'], ledger, settings.get('scratch_dir'))
+            print(f"Resume: {len(known_ids)} known videos will be skipped, {len(partial_ids)} partial downloads will be resumed")
         
-        with yt_dlp.YoutubeDL(download_opts) as ydl:
-            for i, link in enumerate(links, 1):
-                try:
-                    print(f"\n[{i}/{len(links)}] Downloading: {link}")
-                    
-                    add_delay(1, 2)
-                    ydl.download([link])
-                    
-                    downloaded += 1
-                    print(f"Downloaded successfully!")
-                    
-                except KeyboardInterrupt:
-                    print(f"\nStopped by user at video {i}/{len(links)}")
+        pool = DownloadPool(download_opts, workers, settings.get('limiter'), settings.get('cancel_event'),
+                            settings.get('size_budget'), layout)
+        job = {'file': file_path, 'settings': settings}
+        runner = start_queue_runner(job, pool)
+        record_failure = make_failure_recorder(job)
+        
+        link_stats = dict.fromkeys(('lines', 'duplicates', 'known', 'other'), 0)
+        links = iter_link_file(file_path, link_stats, known_ids)
+        queued = 0
+        try:
+            for chunk in iter(lambda: list(itertools.islice(links, LINK_CHUNK_SIZE)), []):
+                if pool.stopped:
                     break
-                except Exception as e:
-                    failed += 1
-                    error_msg = str(e).lower()
-                    if 'sign in' in error_msg or 'bot' in error_msg:
-                        print(f"Bot detection triggered!")
-                        print(f"Stopping to avoid further detection")
+                items = [(url, f"[#{queued + i}]", {'id': video_id, 'url': url, 'downloaded': True} if video_id else None)
+                         for i, (url, video_id) in enumerate(chunk, 1)]
+                queued += len(items)
+                if runner:
+                    runner.put_many(items)
+                    continue
+                for url, label, record in items:
+                    if not pool.submit(url, label, on_success=(lambda record=record: ledger.append(record)) if record else None,
+                                       on_failure=lambda error, url=url, label=label, record=record:
+                                           record_failure(url, label, record, error)):
                         break
-                    else:
-                        print(f"Download failed: {e}")
-                
-                print("-" * 40)
+        except KeyboardInterrupt:
+            pool.stop()
+            log(f"\nStopped by user after queueing {queued} videos")
+        finally:
+            links.close()
+        
+        if runner:
+            runner.finish()
+        pool.close()
+        ledger.sync()
+        downloaded = pool.downloaded
+        
+        if not link_stats['lines']:
+            print("No valid links found in file")
+            summary['status'] = 'empty'
+            return summary
         
         print(f"\nDOWNLOAD COMPLETE!")
         print("=" * 50)
-        print(f"Total links: {len(links)}")
-        print(f"Downloaded: {downloaded}")
-        print(f"Failed: {failed}")
+        print(f"Links read: {link_stats['lines']}")
+        print(f"Skipped: {link_stats['duplicates']} duplicates, {link_stats['known']} already downloaded")
+        print(f"Downloaded: {pool.downloaded}")
+        print(f"Failed: {pool.failed}")
+        if pool.failed and not runner and RETRY_CONFIG['enabled']:
+            print(f"Failed downloads are kept in {RETRY_CONFIG['path']}; retry them with: python ytd.py --retry")
+        if pool.bytes_saved is not None:
+            print(f"Saved vs best: {format_bytes_saved(pool)}")
+        if runner:
+            print(f"Work queue: {format_queue_counts(runner.queue.counts(runner.name))}")
         print(f"Location: {os.path.abspath(settings['output_dir'])}")
         print("=" * 50)
         
+        summary.update(status=pool_status(pool), links=link_stats['lines'], duplicates=link_stats['duplicates'],
+                       skipped=link_stats['known'])
+        
     except KeyboardInterrupt:
+        summary['status'] = 'cancelled'
+        if pool:
+            pool.stop()
+            pool.close()
+            downloaded = pool.downloaded
         print(f"\nOperation cancelled by user")
         print(f"Downloaded {downloaded} videos before stopping")
     except Exception as e:
+        summary.update(status='error', error=str(e))
         print(f"Error: {e}")
+    finally:
+        if pool:
+            pool.close()
+            summary.update(downloaded=pool.downloaded, failed=pool.failed, bytes_saved=pool.bytes_saved)
+        if runner:
+            runner.close()
+            summary['queue'] = runner.queue.counts(runner.name)
+    
+    return summary
+
+METADATA_FORMATS = ('jsonl', 'csv')
+METADATA_FIELDS = ('id', 'title', 'duration', 'upload_date', 'timestamp', 'view_count', 'channel', 'channel_id',
+                   'url', 'thumbnail')
+THUMBNAIL_WORKERS = 8
+THUMBNAIL_BATCH_SIZE = 64
+
+def metadata_record(entry: Dict[str, Any], channel_info: Dict[str, Any] = None) -> Dict[str, Any]:
+    channel_info = channel_info or {}
+    thumbnails = [thumb for thumb in entry.get('thumbnails') or [] if thumb.get('url')]
+    record = {key: entry.get(key) for key in METADATA_FIELDS}
+    record.update(
+        url=entry.get('webpage_url') or entry.get('url'),
+        thumbnail=entry.get('thumbnail') or (thumbnails[-1]['url'] if thumbnails else None),
+        channel=entry.get('channel') or entry.get('uploader') or channel_info.get('channel') or channel_info.get('uploader'),
+        channel_id=entry.get('channel_id') or channel_info.get('channel_id') or channel_info.get('id'),
+    )
+    return record
+
+class CatalogWriter:
+    def __init__(self, path: str, fmt: str = 'jsonl'):
+        self.path = path
+        self.format = fmt
+        self.count = 0
+        self.file = open(path, 'w', newline='' if fmt == 'csv' else None, encoding='utf-8')
+        self.csv = None
+        if fmt == 'csv':
+            self.csv = csv.DictWriter(self.file, fieldnames=METADATA_FIELDS, extrasaction='ignore')
+            self.csv.writeheader()
+
+    def write(self, record: Dict[str, Any]):
+        if self.csv:
+            self.csv.writerow({key: '' if value is None else value for key, value in record.items()})
+        else:
+            self.file.write(json.dumps(record, ensure_ascii=False) + '\n')
+        self.count += 1
+
+    def close(self):
+        if not self.file.closed:
+            self.file.flush()
+            os.fsync(self.file.fileno())
+            self.file.close()
+
+class ThumbnailFetcher:
+    def __init__(self, directory: str, workers: int = THUMBNAIL_WORKERS, batch_size: int = THUMBNAIL_BATCH_SIZE):
+        self.directory = directory
+        self.batch_size = batch_size
+        os.makedirs(directory, exist_ok=True)
+        self.ydl = open_ydl({**get_yt_dlp_options(), 'quiet': True})
+        self.executor = ThreadPoolExecutor(max_workers=max(1, workers))
+        self.batch = []
+        self.in_flight = []
+        self.lock = threading.Lock()
+        self.fetched = 0
+        self.failed = 0
+
+    def add(self, video_id: str, url: str):
+        if not video_id or not url:
+            return
+        self.batch.append((video_id, url))
+        if len(self.batch) >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        # One batch downloads while the scan fills the next, so at most two batches are held at a time
+        wait(self.in_flight)
+        self.in_flight = [self.executor.submit(self._fetch, video_id, url) for video_id, url in self.batch]
+        self.batch = []
+
+    def _fetch(self, video_id: str, url: str):
+        ext = os.path.splitext(urlparse(url).path)[1] or '.jpg'
+        target = os.path.join(self.directory, f"{video_id}{ext}")
+        if os.path.exists(target):
+            return
+        try:
+            with self.ydl.urlopen(url) as response:
+                data = response.read()
+            tmp_path = f"{target}.part"
+            with open(tmp_path, 'wb') as f:
+                f.write(data)
+            os.replace(tmp_path, target)
+        except Exception as e:
+            with self.lock:
+                self.failed += 1
+            log(f"Thumbnail for {video_id} failed: {e}")
+            return
+        with self.lock:
+            self.fetched += 1
+
+    def close(self):
+        self.flush()
+        wait(self.in_flight)
+        self.executor.shutdown(wait=True)
+        self.ydl.close()
+
+def catalog_path(output_dir: str, name: str, fmt: str) -> str:
+    return os.path.join(output_dir, f"{re.sub(r'[^0-9A-Za-z_.-]+', '_', name).strip('_') or 'catalog'}.{fmt}")
+
+def iter_job_metadata(job: Dict[str, Any], stats: Dict[str, int]):
+    if job.get('file'):
+        for url, video_id in iter_link_file(job['file'], stats):
+            info = probe_video(url, video_id)
+            if info:
+                yield metadata_record(info)
+        return
+    
+    shorts_only = job.get('mode', 'shorts') == 'shorts'
+    with open_ydl({**get_yt_dlp_options(), 'quiet': True, 'no_warnings': True, 'extract_flat': True,
+                   'ignoreerrors': False}) as scan_ydl:
+        channel_info, scan_url = open_channel_scan(scan_ydl, job['channel'], shorts_only)
+        if not channel_info or 'entries' not in channel_info:
+            return
+        from_shorts_tab = shorts_only and is_shorts_url(scan_url)
+        channel = {key: channel_info.get(key) for key in ('id', 'channel', 'channel_id', 'uploader')}
+        scan_stream = EntryStream(iter_channel_entries(channel_info, scan_url))
+        try:
+            for entry in scan_stream:
+                keep = prefilter_entry(entry, shorts_only, from_shorts_tab)
+                if keep is None:
+                    entry = probe_video(entry['url'], entry.get('id')) or entry
+                    stats['probes'] += 1
+                    keep = is_short_duration(entry.get('duration'))
+                if keep:
+                    yield metadata_record(entry, channel)
+        finally:
+            scan_stream.close()
+
+def export_metadata(job: Dict[str, Any]) -> Dict[str, Any]:
+    settings = job['settings']
+    fmt = settings['save_metadata']
+    if job.get('file'):
+        summary = new_job_summary(file=job['file'], output_dir=settings['output_dir'])
+        name = Path(job['file']).stem
+    else:
+        summary = new_job_summary(channel=job['channel'], mode=job.get('mode', 'shorts'), output_dir=settings['output_dir'])
+        name = f"{job['channel'].rstrip('/').rsplit('/', 1)[-1]}_{job.get('mode', 'shorts')}"
+    get_rate_controller().reset()
+    Path(settings['output_dir']).mkdir(parents=True, exist_ok=True)
+    path = catalog_path(settings['output_dir'], name, fmt)
+    stats = dict.fromkeys(('lines', 'duplicates', 'known', 'other', 'probes'), 0)
+    writer = CatalogWriter(path, fmt)
+    thumbnails = ThumbnailFetcher(os.path.join(settings['output_dir'], 'thumbnails')) if settings.get('save_thumbnails') else None
+    
+    print(f"\nMETADATA EXPORT")
+    print("-" * 40)
+    print(f"Source: {job.get('file') or job['channel']}")
+    print(f"Catalog: {path}")
+    print(f"Thumbnails: {'Enabled' if thumbnails else 'Disabled'}")
+    print("-" * 40)
+    try:
+        for record in iter_job_metadata(job, stats):
+            if settings.get('cancel_event') is not None and settings['cancel_event'].is_set():
+                summary['status'] = 'cancelled'
+                break
+            writer.write(record)
+            if thumbnails:
+                thumbnails.add(record['id'], record['thumbnail'])
+            if writer.count % 1000 == 0:
+                log(f"Exported {writer.count} videos")
+    except KeyboardInterrupt:
+        summary['status'] = 'cancelled'
+        print(f"\nOperation cancelled by user")
+    except Exception as e:
+        summary.update(status='bot_detected' if is_rate_limited(e) else 'error', error=str(e))
+        print(f"Export failed: {e}")
+    finally:
+        writer.close()
+        if thumbnails:
+            thumbnails.close()
+    
+    summary.update(exported=writer.count, catalog=path, probes=stats['probes'])
+    print(f"Exported {writer.count} videos to {path}")
+    if thumbnails:
+        summary.update(thumbnails=thumbnails.fetched, thumbnails_failed=thumbnails.failed)
+        print(f"Thumbnails: {thumbnails.fetched} saved, {thumbnails.failed} failed")
+    return summary
+
+JOB_MODES = ('shorts', 'all')
+FAILED_JOB_STATUSES = ('error', 'bot_detected', 'cancelled')
+
+def build_settings(output_dir: str = "downloads", quality: str = 'best', **options) -> Dict[str, Any]:
+    return {
+        'output_dir': output_dir,
+        'quality': quality,
+        'save_metadata': False,
+        'save_thumbnails': False,
+        **options,
+    }
+
+def run_job(job: Dict[str, Any]) -> Dict[str, Any]:
+    if job['settings'].get('save_metadata'):
+        return export_metadata(job)
+    if job.get('file'):
+        return download_from_text_file(job['file'], job['settings'])
+    return download_videos_streaming(job['channel'], job['settings'], shorts_only=job.get('mode', 'shorts') == 'shorts')
+
+JOB_SETTING_DEFAULTS = {
+    'workers': 1,
+    'resume': True,
+    'sync': False,
+    'connections': 1,
+    'chunk_size': None,
+    'size_budget': None,
+    'max_height': None,
+    'format_budget': None,
+    'codecs': None,
+    'layout': 'flat',
+    'scratch_dir': None,
+    'save_metadata': False,
+    'save_thumbnails': False,
+}
+JOB_SIZE_SETTINGS = ('chunk_size', 'size_budget', 'format_budget')
+
+def cli_job_defaults(args) -> Dict[str, Any]:
+    return {key: getattr(args, key) for key in JOB_SETTING_DEFAULTS}
+
+def parse_job_spec(spec: Dict[str, Any], label: str = "job", **defaults) -> Dict[str, Any]:
+    if not spec.get('channel') and not spec.get('file'):
+        raise ValueError(f"{label}: needs a 'channel' or 'file'")
+    mode = spec.get('mode', 'shorts')
+    if mode not in JOB_MODES:
+        raise ValueError(f"{label}: mode must be one of {', '.join(JOB_MODES)}")
+    options = {key: spec.get(key, defaults.get(key, default)) for key, default in JOB_SETTING_DEFAULTS.items()}
+    for key in JOB_SIZE_SETTINGS:
+        options[key] = parse_size(options[key])
+    if options['layout'] not in OUTPUT_LAYOUTS:
+        raise ValueError(f"{label}: layout must be one of {', '.join(OUTPUT_LAYOUTS)}")
+    if options['save_metadata'] is True:
+        options['save_metadata'] = METADATA_FORMATS[0]
+    if options['save_metadata'] and options['save_metadata'] not in METADATA_FORMATS:
+        raise ValueError(f"{label}: save_metadata must be one of {', '.join(METADATA_FORMATS)}")
+    options['save_thumbnails'] = bool(options['save_thumbnails'])
+    for key in ('workers', 'connections'):
+        try:
+            options[key] = int(options[key])
+        except (TypeError, ValueError):
+            raise ValueError(f"{label}: {key} must be an integer") from None
+    if isinstance(options['codecs'], str):
+        options['codecs'] = [codec.strip() for codec in options['codecs'].split(',') if codec.strip()]
+    settings = build_settings(spec.get('output_dir', "downloads"), spec.get('quality', 'best'), **options)
+    return {'channel': spec.get('channel'), 'file': spec.get('file'), 'mode': mode, 'settings': settings}
+
+def load_job_file(path: str, args):
+    with open(path, 'r') as f:
+        data = json.load(f)
+    if isinstance(data, list):
+        data = {'jobs': data}
+    
+    defaults = data.get('defaults', {})
+    per_channel = int(data.get('per_channel', args.workers))
+    options = {**cli_job_defaults(args), 'workers': per_channel}
+    jobs = [parse_job_spec({**defaults, **spec}, f"job {i}", **options)
+            for i, spec in enumerate(data.get('jobs', []), 1)]
+    
+    return jobs, int(data.get('max_concurrent', args.max_concurrent))
+
+def run_batch(jobs: List[Dict[str, Any]], max_concurrent: int, cancel_event: threading.Event = None) -> Dict[str, Any]:
+    max_concurrent = max(1, max_concurrent)
+    limiter = threading.BoundedSemaphore(max_concurrent)
+    cancel_event = cancel_event or threading.Event()
+    for job in jobs:
+        job['settings'].update(limiter=limiter, cancel_event=cancel_event, max_concurrent=max_concurrent,
+                               workers=min(job['settings'].get('workers', 1), max_concurrent))
+    
+    started = time.time()
+    results = [None] * len(jobs)
+    with ThreadPoolExecutor(max_workers=min(len(jobs), max_concurrent) or 1) as executor:
+        futures = {executor.submit(run_job, job): i for i, job in enumerate(jobs)}
+        try:
+            for future in as_completed(futures):
+                i = futures[future]
+                try:
+                    results[i] = future.result()
+                except Exception as e:
+                    results[i] = new_job_summary(status='error', error=str(e))
+        except KeyboardInterrupt:
+            cancel_event.set()
+            for future, i in futures.items():
+                try:
+                    results[i] = future.result()
+                except Exception as e:
+                    results[i] = new_job_summary(status='cancelled', error=str(e))
+    
+    return {
+        'jobs': results,
+        'totals': {
+            'jobs': len(jobs),
+            'failed_jobs': sum(1 for result in results if result['status'] in FAILED_JOB_STATUSES),
+            'downloaded': sum(result.get('downloaded', 0) for result in results),
+            'failed': sum(result.get('failed', 0) for result in results),
+        },
+        'elapsed': round(time.time() - started, 2),
+    }
+
+def run_headless(args):
+    try:
+        jobs, max_concurrent = load_job_file(args.jobs, args)
+    except (OSError, ValueError) as e:
+        print(f"Invalid job file {args.jobs}: {e}", file=sys.stderr)
+        return 2
+    
+    if not jobs:
+        print(f"No jobs found in {args.jobs}", file=sys.stderr)
+        return 2
+    
+    summary = run_batch(jobs, max_concurrent)
+    output = json.dumps(summary, indent=2)
+    if args.summary_file:
+        with open(args.summary_file, 'w') as f:
+            f.write(output + '\n')
+    print(output)
+    
+    totals = summary['totals']
+    return 1 if totals['failed_jobs'] or totals['failed'] else 0
+
+def drain_work_queue(work_queue: WorkQueue, name: str, settings: Dict[str, Any]) -> Dict[str, Any]:
+    get_rate_controller().reset()
+    Path(settings['output_dir']).mkdir(parents=True, exist_ok=True)
+    layout = get_output_layout(settings)
+    library = get_library()
+    if library:
+        library.add_root(settings['output_dir'])
+    base_opts = get_yt_dlp_options()
+    
+    pool = DownloadPool(get_download_options(base_opts, settings, layout), settings.get('workers', 1),
+                        settings.get('limiter'), settings.get('cancel_event'), settings.get('size_budget'), layout)
+    runner = QueueRunner(work_queue, name, pool)
+    try:
+        runner.start(producing=False)
+        runner.thread.join()
+    except KeyboardInterrupt:
+        pool.stop()
+        raise
+    finally:
+        pool.close()
+        runner.close()
+        get_ledger().sync()
+    return {'queue': name, 'downloaded': pool.downloaded, 'failed': pool.failed, 'stopped': pool.stopped}
+
+def run_queue_worker(args, wait_for_retries: bool = False):
+    work_queue = get_work_queue()
+    print(f"Worker {work_queue.owner} draining {work_queue.path}")
+    results = []
+    skipped = set()
+    try:
+        while True:
+            names = [name for name in work_queue.claimable_queues() if name not in skipped]
+            if not names:
+                next_retry = work_queue.next_retry() if wait_for_retries else None
+                if next_retry is None:
+                    break
+                delay = max(0.0, next_retry - time.time())
+                log(f"Next retry in {delay:.0f}s ({format_queue_counts(work_queue.counts_all())})")
+                time.sleep(delay)
+                continue
+            name = names[0]
+            try:
+                job = parse_job_spec(work_queue.spec(name) or {}, name)
+            except ValueError as e:
+                log(f"Skipping queue {name}: {e}")
+                skipped.add(name)
+                continue
+            log(f"Draining {name} ({format_queue_counts(work_queue.counts(name))})")
+            result = drain_work_queue(work_queue, name, job['settings'])
+            results.append(result)
+            if result['stopped']:
+                return 1
+    except KeyboardInterrupt:
+        print("\nWorker stopped; leased items were returned to the queue")
+        return 1
+    
+    downloaded = sum(result['downloaded'] for result in results)
+    failed = sum(result['failed'] for result in results)
+    print(f"Worker finished: {downloaded} downloaded, {failed} failed")
+    return 1 if failed else 0
+
+DAEMON_PORT = 8765
+DAEMON_EVENT_LIMIT = 1000
+DAEMON_JOB_HISTORY = 500
+DAEMON_PROGRESS_INTERVAL = 1.0
+DAEMON_ACTIVE_STATUSES = ('queued', 'running')
+
+class DaemonJob:
+    def __init__(self, job_id: str, job: Dict[str, Any]):
+        self.id = job_id
+        self.job = job
+        self.status = 'queued'
+        self.summary = None
+        self.created = time.time()
+        self.started = None
+        self.finished = None
+        self.cancel_event = threading.Event()
+        self.events = collections.deque(maxlen=DAEMON_EVENT_LIMIT)
+        self.seq = 0
+        self.changed = threading.Condition()
+        self.last_progress = {}
+        job['settings'].update(cancel_event=self.cancel_event, progress_hooks=[self._progress_hook])
+
+    @property
+    def done(self):
+        return self.status not in DAEMON_ACTIVE_STATUSES
+
+    def emit(self, event_type: str, **fields):
+        with self.changed:
+            self.seq += 1
+            self.events.append({'seq': self.seq, 'time': round(time.time(), 3), 'type': event_type, **fields})
+            self.changed.notify_all()
+
+    def set_status(self, status: str, **fields):
+        with self.changed:
+            self.status = status
+            self.emit('status', status=status, **fields)
+
+    def _progress_hook(self, status):
+        filename = status.get('filename')
+        if status.get('status') == 'finished':
+            self.last_progress.pop(filename, None)
+            self.emit('file_finished', filename=filename,
+                      bytes=status.get('total_bytes') or status.get('downloaded_bytes'))
+            return
+        now = time.monotonic()
+        if now - self.last_progress.get(filename, 0) < DAEMON_PROGRESS_INTERVAL:
+            return
+        self.last_progress[filename] = now
+        self.emit('progress', filename=filename, downloaded_bytes=status.get('downloaded_bytes'),
+                  total_bytes=status.get('total_bytes') or status.get('total_bytes_estimate'),
+                  speed=status.get('speed'))
+
+    def events_since(self, seq: int, timeout: float):
+        with self.changed:
+            if self.seq <= seq and not self.done:
+                self.changed.wait(timeout)
+            return [event for event in self.events if event['seq'] > seq], self.done
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            'id': self.id,
+            'status': self.status,
+            'channel': self.job.get('channel'),
+            'file': self.job.get('file'),
+            'mode': self.job.get('mode'),
+            'output_dir': self.job['settings']['output_dir'],
+            'created': self.created,
+            'started': self.started,
+            'finished': self.finished,
+            'summary': self.summary,
+        }
+
+class JobDaemon:
+    def __init__(self, max_concurrent: int, **defaults):
+        self.max_concurrent = max(1, max_concurrent)
+        self.defaults = defaults
+        self.limiter = threading.BoundedSemaphore(self.max_concurrent)
+        self.executor = ThreadPoolExecutor(max_workers=self.max_concurrent)
+        self.jobs = collections.OrderedDict()
+        self.lock = threading.Lock()
+
+    def submit(self, spec: Dict[str, Any]) -> DaemonJob:
+        job = parse_job_spec(spec, "job", **self.defaults)
+        job['settings'].update(limiter=self.limiter, max_concurrent=self.max_concurrent,
+                               workers=min(job['settings'].get('workers', 1), self.max_concurrent))
+        daemon_job = DaemonJob(uuid.uuid4().hex[:12], job)
+        with self.lock:
+            self.jobs[daemon_job.id] = daemon_job
+            self._prune()
+        daemon_job.set_status('queued')
+        self.executor.submit(self._run, daemon_job)
+        return daemon_job
+
+    def _prune(self):
+        finished = [job_id for job_id, job in self.jobs.items() if job.done]
+        for job_id in finished[:max(0, len(finished) - DAEMON_JOB_HISTORY)]:
+            del self.jobs[job_id]
+
+    def _run(self, daemon_job: DaemonJob):
+        with daemon_job.changed:
+            if daemon_job.done:
+                return
+            daemon_job.started = time.time()
+            daemon_job.set_status('running')
+        try:
+            summary = run_job(daemon_job.job)
+        except Exception as e:
+            summary = new_job_summary(status='error', error=str(e))
+        daemon_job.summary = summary
+        daemon_job.finished = time.time()
+        daemon_job.set_status(summary['status'], summary=summary)
+
+    def get(self, job_id: str):
+        with self.lock:
+            return self.jobs.get(job_id)
+
+    def list(self) -> List[Dict[str, Any]]:
+        with self.lock:
+            return [job.to_dict() for job in self.jobs.values()]
+
+    def cancel(self, job_id: str):
+        daemon_job = self.get(job_id)
+        if daemon_job is None:
+            return None
+        daemon_job.cancel_event.set()
+        with daemon_job.changed:
+            if daemon_job.status == 'queued':
+                daemon_job.finished = time.time()
+                daemon_job.set_status('cancelled')
+        return daemon_job
+
+    def shutdown(self):
+        with self.lock:
+            job_ids = list(self.jobs)
+        for job_id in job_ids:
+            self.cancel(job_id)
+        self.executor.shutdown(wait=True)
+
+def make_daemon_handler(daemon: JobDaemon):
+    class DaemonHandler(BaseHTTPRequestHandler):
+        def _send_json(self, data, code=200):
+            body = json.dumps(data).encode('utf-8')
+            self.send_response(code)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def _route(self):
+            path, _, query = self.path.partition('?')
+            return [part for part in path.split('/') if part], parse_qs(query)
+
+        def _get_job(self, job_id):
+            daemon_job = daemon.get(job_id)
+            if daemon_job is None:
+                self._send_json({'error': f"unknown job {job_id}"}, 404)
+            return daemon_job
+
+        def do_GET(self):
+            parts, query = self._route()
+            if parts == ['jobs']:
+                self._send_json({'jobs': daemon.list()})
+            elif parts == ['metrics']:
+                body = metrics.to_prometheus().encode('utf-8')
+                self.send_response(200)
+                self.send_header('Content-Type', 'text/plain; version=0.0.4')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+            elif len(parts) == 2 and parts[0] == 'jobs':
+                daemon_job = self._get_job(parts[1])
+                if daemon_job:
+                    self._send_json(daemon_job.to_dict())
+            elif len(parts) == 3 and parts[0] == 'jobs' and parts[2] == 'events':
+                try:
+                    since = int(query.get('since', ['0'])[0])
+                except ValueError:
+                    self._send_json({'error': "since must be an integer"}, 400)
+                    return
+                daemon_job = self._get_job(parts[1])
+                if daemon_job:
+                    self._stream_events(daemon_job, since)
+            else:
+                self.send_error(404)
+
+        def do_POST(self):
+            parts, _ = self._route()
+            if parts == ['jobs']:
+                try:
+                    length = int(self.headers.get('Content-Length', 0))
+                    spec = json.loads(self.rfile.read(length) or b'{}')
+                    if not isinstance(spec, dict):
+                        raise ValueError("job must be a JSON object")
+                    daemon_job = daemon.submit(spec)
+                except (TypeError, ValueError) as e:
+                    self._send_json({'error': str(e)}, 400)
+                    return
+                self._send_json(daemon_job.to_dict(), 201)
+            elif len(parts) == 3 and parts[0] == 'jobs' and parts[2] == 'cancel':
+                self._cancel(parts[1])
+            else:
+                self.send_error(404)
+
+        def do_DELETE(self):
+            parts, _ = self._route()
+            if len(parts) == 2 and parts[0] == 'jobs':
+                self._cancel(parts[1])
+            else:
+                self.send_error(404)
+
+        def _cancel(self, job_id):
+            daemon_job = daemon.cancel(job_id)
+            if daemon_job is None:
+                self._send_json({'error': f"unknown job {job_id}"}, 404)
+            else:
+                self._send_json(daemon_job.to_dict())
+
+        def _stream_events(self, daemon_job, since):
+            self.send_response(200)
+            self.send_header('Content-Type', 'application/x-ndjson')
+            self.end_headers()
+            try:
+                while True:
+                    events, done = daemon_job.events_since(since, timeout=15)
+                    for event in events:
+                        self.wfile.write((json.dumps(event) + '\n').encode('utf-8'))
+                        since = event['seq']
+                    if not events:
+                        if done:
+                            break
+                        self.wfile.write(b'\n')
+                    self.wfile.flush()
+            except (BrokenPipeError, ConnectionResetError):
+                pass
+
+        def log_message(self, format, *args):
+            pass
+
+    return DaemonHandler
+
+def run_daemon(args):
+    open_ydl(get_yt_dlp_options()).close()
+    get_rate_controller()
+    get_metadata_cache()
+    get_ledger()
+    
+    daemon = JobDaemon(args.max_concurrent, **cli_job_defaults(args))
+    server = ThreadingHTTPServer(('127.0.0.1', args.daemon_port), make_daemon_handler(daemon))
+    server.daemon_threads = True
+    print(f"Daemon listening on http://127.0.0.1:{server.server_address[1]}")
+    print("Press Ctrl+C to stop")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print("\nStopping daemon, cancelling running jobs...")
+    finally:
+        server.server_close()
+        daemon.shutdown()
+    return 0
+
+class DaemonClient:
+    def __init__(self, port: int = DAEMON_PORT, host: str = '127.0.0.1'):
+        self.base_url = f"http://{host}:{port}"
+
+    def _request(self, method: str, path: str, data: Dict[str, Any] = None, timeout: float = 30):
+        body = json.dumps(data).encode('utf-8') if data is not None else None
+        request = urllib.request.Request(self.base_url + path, data=body, method=method,
+                                         headers={'Content-Type': 'application/json'})
+        try:
+            with urllib.request.urlopen(request, timeout=timeout) as response:
+                return json.loads(response.read())
+        except urllib.error.HTTPError as e:
+            raise ValueError(json.loads(e.read() or b'{}').get('error', str(e)))
+
+    def ping(self):
+        try:
+            self._request('GET', '/jobs', timeout=5)
+            return True
+        except (OSError, ValueError):
+            return False
+
+    def submit(self, spec: Dict[str, Any]):
+        return self._request('POST', '/jobs', spec)
+
+    def status(self, job_id: str):
+        return self._request('GET', f"/jobs/{job_id}")
+
+    def list(self):
+        return self._request('GET', '/jobs')['jobs']
+
+    def cancel(self, job_id: str):
+        return self._request('POST', f"/jobs/{job_id}/cancel", {})
+
+    def events(self, job_id: str, since: int = 0):
+        with urllib.request.urlopen(f"{self.base_url}/jobs/{job_id}/events?since={since}", timeout=60) as response:
+            for line in response:
+                if line.strip():
+                    yield json.loads(line)
+
+def job_to_spec(job: Dict[str, Any]) -> Dict[str, Any]:
+    settings = job['settings']
+    spec = {
+        'mode': job.get('mode', 'shorts'),
+        'output_dir': os.path.abspath(settings['output_dir']),
+        'quality': settings['quality'],
+        **{key: settings.get(key, default) for key, default in JOB_SETTING_DEFAULTS.items()},
+    }
+    if spec['scratch_dir']:
+        spec['scratch_dir'] = os.path.abspath(spec['scratch_dir'])
+    if job.get('file'):
+        spec['file'] = os.path.abspath(job['file'])
+    else:
+        spec['channel'] = job['channel']
+    return spec
+
+def run_remote_job(client: DaemonClient, job: Dict[str, Any]):
+    daemon_job = client.submit(job_to_spec(job))
+    job_id = daemon_job['id']
+    print(f"\nSubmitted job {job_id} to the daemon")
+    print("Press Ctrl+C to cancel it")
+    print("-" * 40)
+    since = 0
+    while True:
+        try:
+            for event in client.events(job_id, since):
+                since = event['seq']
+                if event['type'] == 'status':
+                    print(f"Status: {event['status']}")
+                elif event['type'] == 'file_finished':
+                    print(f"Downloaded: {Path(event['filename'] or '').name}")
+                elif event['type'] == 'progress' and event.get('total_bytes'):
+                    percent = 100 * (event['downloaded_bytes'] or 0) / event['total_bytes']
+                    print(f"  {Path(event['filename'] or '').name}: {percent:.0f}%")
+            break
+        except KeyboardInterrupt:
+            client.cancel(job_id)
+            print("\nCancel requested")
+        except OSError:
+            if client.status(job_id)['status'] not in DAEMON_ACTIVE_STATUSES:
+                break
+    
+    summary = client.status(job_id).get('summary') or {}
+    print("=" * 50)
+    print(f"Job {job_id}: {summary.get('status', 'cancelled')}")
+    print(f"Downloaded: {summary.get('downloaded', 0)}")
+    print(f"Failed: {summary.get('failed', 0)}")
+    print("=" * 50)
+    return summary
 
 def get_text_file_path():
     print("\nTEXT FILE INPUT")
@@ -508,63 +3961,95 @@ def get_download_settings():
     
     quality_map = {
         '1': 'best',
-        '2': 'best',
-        '3': 'worst'
+        '2': 'good',
+        '3': 'standard'
     }
     
-    return {
-        'output_dir': output_dir,
-        'quality': quality_map[quality_choice],
-        'save_metadata': False,
-        'save_thumbnails': False
-    }
+    save_metadata = False
+    save_thumbnails = False
+    if input("Only save video metadata, without downloading videos? (y/n, default: n): ").strip().lower() == 'y':
+        save_metadata = input("Catalog format (jsonl/csv, default: jsonl): ").strip().lower() or 'jsonl'
+        if save_metadata not in METADATA_FORMATS:
+            print("Unknown format, using jsonl")
+            save_metadata = 'jsonl'
+        save_thumbnails = input("Also save thumbnails? (y/n, default: n): ").strip().lower() == 'y'
+    
+    return build_settings(output_dir, quality_map[quality_choice], save_metadata=save_metadata,
+                          save_thumbnails=save_thumbnails)
 
-def view_previous_downloads():
+def format_library_row(row: Dict[str, Any]) -> str:
+    size_mb = row['size'] / (1024 * 1024)
+    duration = f", {int(row['duration'])}s" if row['duration'] else ""
+    return f"{row['title']} [{row['id'] or '?'}] ({size_mb:.1f} MB{duration})"
+
+def view_previous_downloads(page_size: int = 10):
     print("\nPREVIOUS DOWNLOADS")
     print("-" * 30)
     
-    downloads_dir = Path("downloads")
-    if not downloads_dir.exists():
-        print("No downloads directory found.")
-        return
-    
-    video_files = list(downloads_dir.glob("*.mp4")) + list(downloads_dir.glob("*.webm"))
-    
-    if not video_files:
-        print("No downloaded videos found.")
+    library = get_library()
+    if library is None:
+        print("Library index unavailable.")
+        input("\nPress Enter to continue...")
         return
     
-    print(f"Found {len(video_files)} downloaded videos:")
-    for i, file in enumerate(video_files[:10], 1):
-        size_mb = file.stat().st_size / (1024 * 1024)
-        print(f"  {i}. {file.stem} ({size_mb:.1f} MB)")
-    
-    if len(video_files) > 10:
-        print(f"  ... and {len(video_files) - 10} more")
+    if not library.roots() and Path("downloads").exists():
+        library.add_root("downloads")
+    library.start_reconcile()
     
-    input("\nPress Enter to continue...")
+    search = None
+    sort = 'mtime'
+    offset = 0
+    while True:
+        rows, total = library.query(search, sort, sort in ('mtime', 'size', 'duration'), page_size, offset)
+        if library.reconciling.is_set():
+            print("(Refreshing the index in the background, press r to reload)")
+        if not total:
+            print("No downloaded videos found." if not search else f"No videos matching '{search}'.")
+        else:
+            last = offset + len(rows)
+            print(f"Videos {offset + 1}-{last} of {total} (sorted by {sort}{', search: ' + search if search else ''}):")
+            for i, row in enumerate(rows, offset + 1):
+                print(f"  {i}. {format_library_row(row)}")
+        
+        command = input("\n[n]ext, [p]revious, [s]earch, s[o]rt, [r]eload, Enter to go back: ").strip().lower()
+        if command == 'n' and offset + page_size < total:
+            offset += page_size
+        elif command == 'p':
+            offset = max(0, offset - page_size)
+        elif command == 's':
+            search = input("Search title or video ID (empty to clear): ").strip() or None
+            offset = 0
+        elif command == 'o':
+            choice = input(f"Sort by ({', '.join(LIBRARY_SORTS)}): ").strip().lower()
+            if choice in LIBRARY_SORTS:
+                sort = choice
+                offset = 0
+        elif command == 'r':
+            continue
+        elif not command:
+            return
+        print()
 
 def load_from_saved_list():
     print("\nLOAD FROM SAVED LIST")
     print("-" * 30)
     
-    list_file = Path("downloaded_videos.json")
-    if not list_file.exists():
+    migrate_legacy_log()
+    if not Path(LEDGER_FILE).exists():
         print("No saved video list found.")
         input("Press Enter to continue...")
         return
     
     try:
-        with open(list_file, 'r') as f:
-            videos = json.load(f)
+        total = count_ledger()
         
-        print(f"Found saved list with {len(videos)} videos")
+        print(f"Found saved list with {total} videos")
         
-        for video in videos[:5]:
-            print(f"  - {video['title']} ({video.get('duration', 'N/A')}s)")
+        for video in itertools.islice(iter_ledger(), 5):
+            print(f"  - {video.get('title') or video['id']} ({video.get('duration', 'N/A')}s)")
         
-        if len(videos) > 5:
-            print(f"  ... and {len(videos) - 5} more")
+        if total > 5:
+            print(f"  ... and {total - 5} more")
         
         input("\nPress Enter to continue...")
         
@@ -572,58 +4057,186 @@ def load_from_saved_list():
         print(f"Error loading saved list: {e}")
         input("Press Enter to continue...")
 
-def main():
-    if not install_yt_dlp():
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="YouTube Video Downloader")
+    parser.add_argument('--workers', type=int, default=1,
+                        help="number of parallel downloads (default: 1)")
+    parser.add_argument('--connections', type=int, default=1,
+                        help="parallel connections per download for fragmented (DASH/HLS) formats only; YouTube's "
+                             "default https formats always use one connection (default: 1)")
+    parser.add_argument('--chunk-size', type=parse_size, metavar='SIZE',
+                        help="fetch https formats in sequential ranged requests of this size, e.g. 10M")
+    parser.add_argument('--max-connections', type=int, default=16,
+                        help="cap on connections across all workers of a job (default: 16)")
+    parser.add_argument('--ffmpeg-workers', type=int, default=POSTPROCESS_CONFIG['workers'],
+                        help="FFmpeg merges/transcodes run at once, separate from downloads; 0 merges inline "
+                             f"(default: {POSTPROCESS_CONFIG['workers']})")
+    parser.add_argument('--size-budget', type=parse_size, metavar='SIZE',
+                        help="transcode downloads larger than this (e.g. 200M) down to fit, using FFmpeg")
+    parser.add_argument('--max-height', type=int,
+                        help="highest video resolution to pick, e.g. 720 (overrides the quality preset's cap)")
+    parser.add_argument('--format-budget', type=parse_size, metavar='SIZE',
+                        help="pick the best format whose estimated size fits this per-video budget, e.g. 50M")
+    parser.add_argument('--codecs', type=lambda value: [codec.strip() for codec in value.split(',') if codec.strip()],
+                        help="video codec preference, most preferred first (default: av01,vp9,avc1)")
+    parser.add_argument('--layout', choices=OUTPUT_LAYOUTS, default='flat',
+                        help="output layout: flat, id (subdirectories by video id prefix) or channel (channel/year)")
+    parser.add_argument('--scratch-dir', metavar='DIR',
+                        help="download into this directory and atomically move finished files into the output directory")
+    parser.add_argument('--migrate-layout', metavar='DIR',
+                        help="move the files of a flat output directory into --layout and exit")
+    parser.add_argument('--metadata-only', dest='save_metadata', nargs='?', const='jsonl', default=False,
+                        choices=METADATA_FORMATS,
+                        help="write a catalog of the videos (jsonl or csv, default jsonl) instead of downloading them")
+    parser.add_argument('--thumbnails', dest='save_thumbnails', action='store_true',
+                        help="with --metadata-only, also save each video's thumbnail")
+    parser.add_argument('--no-cache', dest='cache', action='store_false',
+                        help="do not read or write the local metadata cache")
+    parser.add_argument('--cache-size', type=int, default=256, metavar='MB',
+                        help="maximum metadata cache size in megabytes (default: 256)")
+    parser.add_argument('--sync', action='store_true',
+                        help="only walk channel uploads newer than the last synced video")
+    parser.add_argument('--no-resume', dest='resume', action='store_false',
+                        help="re-check every channel video instead of skipping ones already downloaded")
+    parser.add_argument('--cookies', default=COOKIE_FILE, metavar='FILE',
+                        help=f"Netscape cookie file shared by all requests and updated at exit (default: {COOKIE_FILE})")
+    parser.add_argument('--rate', type=float, default=1.0,
+                        help="starting request rate in requests per second; adapts while running (default: 1.0)")
+    parser.add_argument('--max-rate', type=float, default=10.0,
+                        help="upper limit for the adaptive request rate (default: 10.0)")
+    parser.add_argument('--stats-file', metavar='FILE',
+                        help="periodically write throughput and phase timing stats to this JSON file")
+    parser.add_argument('--stats-interval', type=float, default=10.0,
+                        help="seconds between stats file writes (default: 10)")
+    parser.add_argument('--metrics-port', type=int,
+                        help="serve Prometheus metrics on http://127.0.0.1:PORT/metrics")
+    parser.add_argument('--trace', metavar='FILE',
+                        help="record timed spans of every step and write them as a Chrome/Perfetto trace at exit")
+    parser.add_argument('--profile', metavar='FILE',
+                        help="sample all thread stacks while running and write collapsed stacks for a flame graph")
+    parser.add_argument('--profile-interval', type=float, default=5.0, metavar='MS',
+                        help="milliseconds between profiler samples (default: 5)")
+    parser.add_argument('--jobs', metavar='FILE',
+                        help="run the jobs in a JSON job file without the interactive menu")
+    parser.add_argument('--max-concurrent', type=int, default=4,
+                        help="maximum downloads running at once across all jobs (default: 4)")
+    parser.add_argument('--summary-file', metavar='FILE',
+                        help="also write the JSON batch summary to this file")
+    parser.add_argument('--dedup', action='store_true',
+                        help="replace each finished download that is byte-identical to an existing file with a link")
+    parser.add_argument('--dedup-link', choices=DEDUP_LINK_MODES, default='auto',
+                        help="how duplicates are replaced: reflink, hardlink, or auto (reflink, then hardlink)")
+    parser.add_argument('--dedup-scan', nargs='+', metavar='DIR',
+                        help="deduplicate existing files in these directories and exit")
+    parser.add_argument('--dedup-workers', type=int, default=4,
+                        help="parallel hashing threads for --dedup-scan (default: 4)")
+    parser.add_argument('--daemon', action='store_true',
+                        help="run as a long-lived daemon that accepts jobs over a localhost HTTP API")
+    parser.add_argument('--daemon-port', type=int, default=DAEMON_PORT,
+                        help=f"port of the daemon's HTTP API (default: {DAEMON_PORT})")
+    parser.add_argument('--use-daemon', action='store_true',
+                        help="send menu downloads to a running daemon instead of downloading in this process")
+    parser.add_argument('--queue', metavar='FILE', nargs='?', const=QUEUE_FILE,
+                        help=f"route downloads through a durable SQLite work queue (default file: {QUEUE_FILE})")
+    parser.add_argument('--worker', action='store_true',
+                        help="drain the work queue of --queue alongside other processes, then exit")
+    parser.add_argument('--retry', action='store_true',
+                        help=f"retry failed downloads from {RETRY_FILE} (or --queue) with exponential backoff, then exit")
+    parser.add_argument('--max-attempts', type=int, default=RETRY_CONFIG['max_attempts'],
+                        help=f"attempts before a failed download is given up (default: {RETRY_CONFIG['max_attempts']})")
+    parser.add_argument('--lease', type=float, default=QUEUE_CONFIG['lease'], metavar='SECONDS',
+                        help=f"how long a claimed queue item stays reserved without a heartbeat (default: {QUEUE_CONFIG['lease']:.0f})")
+    return parser.parse_args(argv)
+
+def apply_cli_settings(settings: Dict[str, Any], args):
+    # Choices made in the menu (metadata export) win over options left unset on the command line
+    settings.update({key: value for key, value in cli_job_defaults(args).items() if value or key not in settings})
+    return settings
+
+def run_menu_job(job: Dict[str, Any], client: DaemonClient = None):
+    try:
+        if client:
+            run_remote_job(client, job)
+        else:
+            run_job(job)
+        input("\nPress Enter to continue...")
+    except KeyboardInterrupt:
+        print("\n\nOperation cancelled by user")
+        input("Press Enter to continue...")
+    except Exception as e:
+        print(f"Error: {e}")
+        input("Press Enter to continue...")
+
+def main(argv=None):
+    args = parse_args(argv)
+    CACHE_CONFIG['enabled'] = args.cache
+    CACHE_CONFIG['max_bytes'] = args.cache_size * 1024 * 1024
+    CONNECTION_CONFIG['max_connections'] = max(1, args.max_connections)
+    POSTPROCESS_CONFIG['workers'] = max(0, args.ffmpeg_workers)
+    RATE_CONFIG['rate'] = args.rate
+    SESSION_CONFIG['cookie_file'] = args.cookies
+    RATE_CONFIG['max_rate'] = max(args.rate, args.max_rate)
+    if args.trace:
+        tracer.start(args.trace)
+    if args.profile:
+        SamplingProfiler(args.profile, max(0.001, args.profile_interval / 1000)).start()
+    if args.stats_file:
+        start_stats_writer(args.stats_file, args.stats_interval)
+    if args.metrics_port is not None:
+        start_metrics_server(args.metrics_port)
+    DEDUP_CONFIG['enabled'] = args.dedup
+    DEDUP_CONFIG['link'] = args.dedup_link
+    QUEUE_CONFIG['path'] = args.queue or (QUEUE_FILE if args.worker else RETRY_CONFIG['path'] if args.retry else None)
+    RETRY_CONFIG['max_attempts'] = max(1, args.max_attempts)
+    QUEUE_CONFIG['lease'] = max(10.0, args.lease)
+    
+    if args.migrate_layout:
+        migrate_layout(args.migrate_layout, args.layout)
+        sys.exit(0)
+    
+    if args.dedup_scan:
+        result = run_dedup_pass(args.dedup_scan, args.dedup_workers, args.dedup_link, DEDUP_CONFIG['min_size'])
+        sys.exit(0 if result is not None else 1)
+    
+    client = None
+    if args.use_daemon:
+        client = DaemonClient(args.daemon_port)
+        if not client.ping():
+            print(f"No daemon running on port {args.daemon_port}. Start one with: python ytd.py --daemon")
+            return
+    elif not install_yt_dlp():
         print("Failed to install required dependencies")
         return
     
+    if args.daemon:
+        sys.exit(run_daemon(args))
+    
+    if args.worker or args.retry:
+        sys.exit(run_queue_worker(args, wait_for_retries=args.retry))
+    
+    if args.jobs:
+        sys.exit(run_headless(args))
+    
+    library = get_library()
+    if library:
+        library.start_reconcile()
+    
     while True:
         show_banner()
         show_main_menu()
         
         choice = get_user_choice()
         
-        if choice == 1:
-            channel_url = get_channel_url()
-            settings = get_download_settings()
-            
-            try:
-                download_videos_streaming(channel_url, settings, shorts_only=True)
-                input("\nPress Enter to continue...")
-            except KeyboardInterrupt:
-                print("\n\nOperation cancelled by user")
-                input("Press Enter to continue...")
-            except Exception as e:
-                print(f"Error: {e}")
-                input("Press Enter to continue...")
-        
-        elif choice == 2:
+        if choice in (1, 2):
             channel_url = get_channel_url()
-            settings = get_download_settings()
-            
-            try:
-                download_videos_streaming(channel_url, settings, shorts_only=False)
-                input("\nPress Enter to continue...")
-            except KeyboardInterrupt:
-                print("\n\nOperation cancelled by user")
-                input("Press Enter to continue...")
-            except Exception as e:
-                print(f"Error: {e}")
-                input("Press Enter to continue...")
+            settings = apply_cli_settings(get_download_settings(), args)
+            run_menu_job({'channel': channel_url, 'mode': 'shorts' if choice == 1 else 'all', 'settings': settings}, client)
         
         elif choice == 3:
             file_path = get_text_file_path()
             if file_path:
-                settings = get_download_settings()
-                try:
-                    download_from_text_file(file_path, settings)
-                    input("\nPress Enter to continue...")
-                except KeyboardInterrupt:
-                    print("\n\nOperation cancelled by user")
-                    input("Press Enter to continue...")
-                except Exception as e:
-                    print(f"Error: {e}")
-                    input("Press Enter to continue...")
+                settings = apply_cli_settings(get_download_settings(), args)
+                run_menu_job({'file': file_path, 'settings': settings}, client)
         
         elif choice == 4:
             view_previous_downloads()